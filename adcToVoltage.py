@@ -0,0 +1,257 @@
+"""
+Conversion of ADC counts to voltage by inverting the calibration curves (polynomial + averaged residual)
+"""
+
+import numpy as np
+from numba import jit, prange
+
+
+def get_samples_idx(starting_window, nr_samples = 2048):
+    """
+    Sample indices (into the 4096 calibrated samples) of a waveform that starts on starting_window
+    starting_window : scalar or array, an axis of length nr_samples is appended
+    """
+    # bias scans always start on window 0
+    # the two buffers run from window [0 - 15] and [16 - 31]
+    # each window contains 128 samples
+    # normal data start on a "random" window
+    starting_window = np.asarray(starting_window)[..., np.newaxis]
+    samples_idx = (128 * starting_window + np.arange(nr_samples)) % 2048
+    samples_idx += 2048 * (starting_window >= 16)
+    return samples_idx
+
+
+def extend_buffers(array):
+    """
+    array : shape [channels, 4096, ...]
+    returns shape [channels, 2, 4096, ...] with each of the two 2048 sample buffers repeated twice,
+    so that the reordered samples of any starting window are a contiguous slice (see window_view)
+    """
+    buffers = array.reshape(array.shape[0], 2, 2048, *array.shape[2:])
+    return np.concatenate([buffers, buffers], axis = 2)
+
+
+def window_view(extended, starting_window, nr_samples = 2048):
+    """
+    View of an extend_buffers array, equivalent to array[:, get_samples_idx(starting_window, nr_samples)]
+    """
+    offset = 128 * (int(starting_window) % 16)
+    return extended[:, int(starting_window >= 16), offset : offset + nr_samples]
+
+
+def group_by_starting_window(starting_window):
+    """
+    returns a list of (starting window, event indices) for every starting window present
+    """
+    starting_window = np.asarray(starting_window)
+    order = np.argsort(starting_window, kind = "stable")
+    windows, first = np.unique(starting_window[order], return_index = True)
+    return list(zip(windows, np.split(order, first[1:])))
+
+
+def evaluate_curve_and_slope(v, coeffs, vres, res, coeff_idx = None):
+    """
+    Horner evaluation of the calibration curve and its derivative
+    v : shape [...]
+    coeffs : shape [order, ...] (note the order axis comes first), broadcastable to v
+    vres, res : residual of one DAC
+    coeff_idx : if given, the coefficients used are coeffs[:, coeff_idx], gathered one order at a time
+    """
+    adc = np.zeros_like(v)
+    slope = np.zeros_like(v)
+    for k in range(len(coeffs) - 1, -1, -1):
+        slope = slope * v + adc
+        adc = adc * v + (coeffs[k] if coeff_idx is None else coeffs[k][coeff_idx])
+    idx = np.clip(np.searchsorted(vres, v, side = "right"), 1, len(vres) - 1)
+    res_slope = (res[idx] - res[idx - 1]) / (vres[idx] - vres[idx - 1])
+    adc += res_slope * (v - vres[idx - 1]) + res[idx - 1]
+    slope += res_slope
+    return adc, slope
+
+
+def solve_adc_to_v(adc, coeffs, vres, res, v_min = -1.3, v_max = 0.7, tol = 1e-6, max_iter = 50):
+    """
+    Inverts the calibration curves for all samples at once using Newton iterations,
+    safeguarded by a bisection step whenever Newton leaves the bracket [v_min, v_max]
+    adc : shape [...]
+    coeffs : shape broadcastable to [..., order], e.g. [channels, samples, order] for adc of [events, channels, samples]
+    vres, res : residual of one DAC
+    returns the voltages and a boolean array which is False for samples that did not converge,
+    samples whose adc value is outside of the curve on [v_min, v_max] are set to the closest bracket end
+    """
+    adc = np.asarray(adc, dtype = np.float64)
+    coeffs = np.asarray(coeffs)
+    vres = np.asarray(vres, dtype = np.float64)
+    res = np.asarray(res, dtype = np.float64)
+    shape = np.broadcast_shapes(adc.shape, coeffs.shape[:-1])
+
+    # instead of broadcasting the coefficients (one copy per event), every sample keeps an index into them
+    coeffs_flat = np.ascontiguousarray(coeffs.reshape(-1, coeffs.shape[-1]).T, dtype = np.float64)
+    coeff_idx = np.broadcast_to(np.arange(coeffs_flat.shape[1]).reshape(coeffs.shape[:-1]), shape).ravel()
+    target = np.broadcast_to(adc, shape).ravel()
+
+    v = np.empty(target.shape)
+    converged = np.zeros(target.shape, dtype = bool)
+
+    f_min = evaluate_curve_and_slope(np.full(target.shape, float(v_min)), coeffs_flat, vres, res, coeff_idx)[0] - target
+    f_max = evaluate_curve_and_slope(np.full(target.shape, float(v_max)), coeffs_flat, vres, res, coeff_idx)[0] - target
+    below, above = f_min > 0, f_max < 0
+    v[below] = v_min
+    v[above] = v_max
+
+    active = np.flatnonzero(~below & ~above)
+    lo = np.full(active.shape, float(v_min))
+    hi = np.full(active.shape, float(v_max))
+    f_lo, f_hi = f_min[active], f_max[active]
+    # regula falsi starting point
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        x = np.where(f_hi > f_lo, lo - f_lo * (hi - lo) / (f_hi - f_lo), 0.5 * (lo + hi))
+
+    for _ in range(max_iter):
+        if len(active) == 0:
+            break
+        f, df = evaluate_curve_and_slope(x, coeffs_flat, vres, res, coeff_idx[active])
+        f -= target[active]
+
+        negative = f < 0
+        lo = np.where(negative, x, lo)
+        hi = np.where(negative, hi, x)
+
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            x_new = x - f / df
+        bisect = ~(df > 0) | ~(x_new > lo) | ~(x_new < hi)
+        x_new = np.where(bisect, 0.5 * (lo + hi), x_new)
+        # an exact root sets hi = x, which sends Newton to the bisection step, keep x itself
+        x_new = np.where(f == 0, x, x_new)
+
+        done = (np.abs(x_new - x) <= tol) | (hi - lo <= tol)
+        v[active[done]] = x_new[done]
+        converged[active[done]] = True
+
+        keep = ~done
+        active, x, lo, hi = active[keep], x_new[keep], lo[keep], hi[keep]
+
+    # whatever is left did not converge within max_iter, report the last iterate
+    v[active] = x
+    return v.reshape(shape), converged.reshape(shape)
+
+
+@jit(nopython = True, parallel = True)
+def interpolate_rows(x, y, targets, out):
+    """
+    Linear interpolation of y(x) for every row of x at the targets of that row
+    x : shape [rows, points], non-decreasing along each row
+    y : shape [points], shared by all rows
+    targets : shape [rows, n], ascending along each row, values outside of x are clipped to the ends
+    """
+    for r in prange(x.shape[0]):
+        j = 1
+        for t in range(targets.shape[1]):
+            target = targets[r, t]
+            while j < x.shape[1] - 1 and x[r, j] < target:
+                j += 1
+            x0, x1 = x[r, j - 1], x[r, j]
+            frac = 0.
+            if x1 > x0:
+                frac = min(max((target - x0) / (x1 - x0), 0.), 1.)
+            out[r, t] = y[j - 1] + frac * (y[j] - y[j - 1])
+    return out
+
+
+class InverseTable():
+    """
+    Precomputed approximate inverse V(ADC) of every (channel, sample) curve of a voltageCalibration,
+    so that converting ADC to voltage is a single table or polynomial evaluation
+    method "lut" : piecewise linear table on a uniform ADC grid per sample (O(1) lookup)
+    method "chebyshev" : Chebyshev series of V(ADC) per sample
+    accuracy : table points per volt (as in the discrete inverse of cal_adc_to_v),
+               for the Chebyshev method the series is built from `degree` + 1 nodes instead
+    After building, max_error holds the largest inversion error in V found on a test grid
+    and sample_error the same per (channel, sample)
+    """
+    def __init__(self, vc, method = "lut", accuracy = 100, degree = 15, v_min = -1.3, v_max = 0.7,
+                 oversampling = 4) -> None:
+        if method not in ["lut", "chebyshev"]:
+            raise ValueError(f"Unknown inverse table method {method}")
+        self.method = method
+        self.v_min, self.v_max = v_min, v_max
+        nr_channels, nr_samples = vc.coeffs.shape[:2]
+
+        nr_knots = int(round((v_max - v_min) * accuracy)) + 1
+        v_dense = np.linspace(v_min, v_max, oversampling * (nr_knots - 1) + 1)
+        # test points lie in between the dense points, where the interpolation is worst
+        v_test = 0.5 * (v_dense[1:] + v_dense[:-1])
+
+        self.adc_lo = np.empty((nr_channels, nr_samples))
+        self.adc_hi = np.empty((nr_channels, nr_samples))
+        if method == "lut":
+            self.table = np.empty((nr_channels, nr_samples, nr_knots), dtype = np.float32)
+        else:
+            nodes = -np.cos(np.pi * (np.arange(degree + 1) + 0.5) / (degree + 1))
+            # discrete orthogonality of the Chebyshev polynomials on their nodes
+            cheb_matrix = np.polynomial.chebyshev.chebvander(nodes, degree) * 2 / (degree + 1)
+            cheb_matrix[:, 0] /= 2
+            self.table = np.empty((nr_channels, nr_samples, degree + 1))
+        self.sample_error = np.empty((nr_channels, nr_samples))
+
+        # built channel per channel to keep the dense curves small
+        for ch in range(nr_channels):
+            adc_dense = vc.get_fit_curves(v_dense, channels = [ch], dtype = np.float64)[0]
+            adc_dense = np.maximum.accumulate(adc_dense, axis = -1)
+            lo, hi = adc_dense[:, 0], adc_dense[:, -1]
+            self.adc_lo[ch], self.adc_hi[ch] = lo, hi
+
+            if method == "lut":
+                targets = lo[:, np.newaxis] + (hi - lo)[:, np.newaxis] * np.linspace(0, 1, nr_knots)
+                interpolate_rows(adc_dense, v_dense, targets, self.table[ch])
+            else:
+                targets = lo[:, np.newaxis] + (hi - lo)[:, np.newaxis] * 0.5 * (nodes + 1)
+                v_nodes = interpolate_rows(adc_dense, v_dense, targets, np.empty(targets.shape))
+                self.table[ch] = v_nodes @ cheb_matrix
+
+            adc_test = vc.get_fit_curves(v_test, channels = [ch], dtype = np.float64)[0]
+            rows = ch * nr_samples + np.arange(nr_samples)[:, np.newaxis]
+            v_inv = self.lookup(adc_test, np.broadcast_to(rows, adc_test.shape))
+            self.sample_error[ch] = np.max(np.abs(v_inv - v_test), axis = -1)
+        self.max_error = np.max(self.sample_error)
+
+    def adc_to_v(self, adc, starting_window = 0, channels = None):
+        """
+        adc : shape [events, channels, samples]
+        starting_window : scalar or shape [events]
+        channels : channel numbers of the channel axis of adc, range(adc.shape[1]) if None
+        returns v of shape [events, channels, samples], clipped to [v_min, v_max]
+        """
+        adc = np.asarray(adc, dtype = np.float64)
+        channels = np.arange(adc.shape[1]) if channels is None else np.atleast_1d(channels)
+        samples_idx = get_samples_idx(starting_window, adc.shape[-1])
+        if samples_idx.ndim > 1:
+            samples_idx = samples_idx[:, np.newaxis]
+        # flat (channel, sample) row of every adc value, the tables are gathered through it instead of copied
+        rows = channels[:, np.newaxis] * self.table.shape[1] + samples_idx
+        return self.lookup(adc, np.broadcast_to(rows, adc.shape))
+
+    def lookup(self, adc, rows):
+        """
+        adc : ADC values of any shape
+        rows : flat (channel * samples + sample) index of the curve belonging to every ADC value
+        """
+        lo = self.adc_lo.ravel()[rows]
+        width = np.maximum(self.adc_hi.ravel()[rows] - lo, 1e-12)
+        table = self.table.reshape(-1, self.table.shape[-1])
+        if self.method == "lut":
+            pos = np.clip((adc - lo) / width, 0., 1.) * (table.shape[-1] - 1)
+            idx = np.minimum(pos.astype(np.int64), table.shape[-1] - 2)
+            frac = pos - idx
+            flat = table.ravel()
+            flat_idx = rows * table.shape[-1] + idx
+            return (1. - frac) * flat[flat_idx] + frac * flat[flat_idx + 1]
+
+        # Clenshaw recursion
+        x = np.clip(2 * (adc - lo) / width - 1, -1., 1.)
+        b1 = np.zeros_like(x)
+        b2 = np.zeros_like(x)
+        for k in range(table.shape[-1] - 1, 0, -1):
+            b1, b2 = 2 * x * b1 - b2 + table[rows, k], b1
+        v = x * b1 - b2 + table[rows, 0]
+        return np.clip(v, self.v_min, self.v_max)
@@ -0,0 +1,137 @@
+"""
+Exact window metrics of calibration curves computed from the coefficients instead of sampled curves.
+A curve is a polynomial plus the piecewise linear residual of its DAC, so over a window [v_min, v_max]
+    mean((f_1 - f_0)^2) = dc G dc^T + 2 dc . mu + rho
+    mean(f_1 - f_0) = dc . m + mean(dr)
+with dc the coefficient difference, G the Gram matrix of the monomials (mean of v^j v^k over the window),
+m the monomial means, dr the residual difference, mu the means of v^k dr and rho the mean of dr^2.
+G, m, mu and rho are computed once per window (and per residual pair) with Gauss-Legendre quadrature,
+which is exact for these polynomial integrands, so the metric of all channels and samples is a few matrix products.
+"""
+
+import numpy as np
+
+from voltageCalibration import interpolate_residual, NR_CHANNELS
+from linearity import V_TO_ADC
+
+
+def gauss_legendre(a, b, nr_nodes):
+    """
+    Nodes and weights for the mean over [a, b] (weights sum to 1), exact up to degree 2 * nr_nodes - 1
+    """
+    x, w = np.polynomial.legendre.leggauss(nr_nodes)
+    return 0.5 * (b - a) * x + 0.5 * (b + a), 0.5 * w
+
+
+def linear_coeffs(slope = V_TO_ADC, order = 10):
+    """
+    Coefficients of the line adc = slope * v, to compare a calibration to an ideal ADC
+    """
+    coeffs = np.zeros(order)
+    coeffs[1] = slope
+    return coeffs
+
+
+class WindowMetrics():
+    """
+    Gram factor and monomial means of one voltage window
+    v_min, v_max : window the metrics are averaged over
+    order : number of polynomial coefficients (pol9 has 10)
+    """
+    def __init__(self, v_min, v_max, order = 10) -> None:
+        self.v_min = v_min
+        self.v_max = v_max
+        self.order = order
+        # the square of a polynomial of degree order - 1 is integrated exactly with order nodes
+        nodes, weights = gauss_legendre(v_min, v_max, order)
+        # G = factor @ factor.T, so dc G dc^T = |dc @ factor|^2 without forming G
+        self.factor = (nodes[:, np.newaxis] ** np.arange(order)).T * np.sqrt(weights)
+        k = np.arange(1, order + 1)
+        self.moments = (v_max**k - v_min**k) / (k * (v_max - v_min))
+
+    @property
+    def gram(self):
+        return self.factor @ self.factor.T
+
+    def residual_terms(self, vres_0 = None, res_0 = None, vres_1 = None, res_1 = None):
+        """
+        mu (shape [order]), mean(dr) and mean(dr^2) of dr = r_1 - r_0, a missing residual counts as 0.
+        The residual difference is linear between the union of the residual points, every piece is
+        integrated with Gauss-Legendre nodes (exact for v^k times a line)
+        """
+        breakpoints = [self.v_min, self.v_max]
+        for vres in [vres_0, vres_1]:
+            if vres is not None:
+                breakpoints = np.concatenate([breakpoints, vres[(self.v_min < vres) & (vres < self.v_max)]])
+        breakpoints = np.unique(breakpoints)
+
+        nodes, weights = gauss_legendre(-1., 1., self.order // 2 + 1)
+        half_width = 0.5 * np.diff(breakpoints)[:, np.newaxis]
+        v = half_width * (nodes + 1.) + breakpoints[:-1, np.newaxis]
+        weights = (weights * 2. * half_width / (self.v_max - self.v_min)).ravel()
+        v = v.ravel()
+
+        dr = np.zeros_like(v)
+        if res_1 is not None:
+            dr += interpolate_residual(v, vres_1, res_1)
+        if res_0 is not None:
+            dr -= interpolate_residual(v, vres_0, res_0)
+        powers = v ** np.arange(self.order)[:, np.newaxis]
+        return powers @ (weights * dr), np.sum(weights * dr), np.sum(weights * dr**2)
+
+    def mean_square(self, delta_coeffs, residual_terms = None):
+        """
+        mean((f_1 - f_0)^2) over the window, delta_coeffs : coeffs_1 - coeffs_0 of shape [..., order]
+        """
+        delta_coeffs = np.asarray(delta_coeffs, dtype = np.float64)
+        mean_square = np.sum((delta_coeffs @ self.factor)**2, axis = -1)
+        if residual_terms is not None:
+            mu, _, rho = residual_terms
+            mean_square += 2. * delta_coeffs @ mu + rho
+        # rounding can give tiny negative values for identical curves
+        return np.maximum(mean_square, 0.)
+
+    def mean(self, delta_coeffs, residual_terms = None):
+        """
+        mean(f_1 - f_0) over the window
+        """
+        mean = np.asarray(delta_coeffs, dtype = np.float64) @ self.moments
+        if residual_terms is not None:
+            mean += residual_terms[1]
+        return mean
+
+    def _per_dac(self, channels, function):
+        channels = np.arange(NR_CHANNELS) if channels is None else np.atleast_1d(channels)
+        results = [None] * len(channels)
+        for dac in range(2):
+            dac_idx = np.flatnonzero((channels > 11) == dac)
+            if len(dac_idx) > 0:
+                for i, result in zip(dac_idx, function(channels[dac_idx], dac)):
+                    results[i] = result
+        return np.array(results)
+
+    def drift(self, vc_0, vc_1, channels = None):
+        """
+        RMS and mean signed difference of vc_1 - vc_0 over the window, both of shape [channels, samples]
+        """
+        def dac_drift(dac_channels, dac):
+            terms = self.residual_terms(vc_0.vres[:, dac], vc_0.res[:, dac], vc_1.vres[:, dac], vc_1.res[:, dac])
+            # the difference of float32 coefficients is taken in float64 to keep it exact
+            delta_coeffs = (vc_1.load_channels(dac_channels)[dac_channels].astype(np.float64)
+                            - vc_0.load_channels(dac_channels)[dac_channels])
+            return np.stack([np.sqrt(self.mean_square(delta_coeffs, terms)), self.mean(delta_coeffs, terms)], axis = 1)
+
+        drift = self._per_dac(channels, dac_drift)
+        return drift[:, 0], drift[:, 1]
+
+    def deviation_from_linear(self, vc, channels = None, slope = V_TO_ADC):
+        """
+        RMS and mean signed deviation of the calibration from adc = slope * v, shape [channels, samples]
+        """
+        def dac_deviation(dac_channels, dac):
+            terms = self.residual_terms(vres_1 = vc.vres[:, dac], res_1 = vc.res[:, dac])
+            delta_coeffs = vc.load_channels(dac_channels)[dac_channels] - linear_coeffs(slope, self.order)
+            return np.stack([np.sqrt(self.mean_square(delta_coeffs, terms)), self.mean(delta_coeffs, terms)], axis = 1)
+
+        deviation = self._per_dac(channels, dac_deviation)
+        return deviation[:, 0], deviation[:, 1]
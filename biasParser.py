@@ -1,32 +1,122 @@
+import os
 import glob
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from runCatalog import get_number
+
+
+EXECUTORS = {"thread" : ThreadPoolExecutor, "process" : ProcessPoolExecutor}
+
+
+def get_run_key(run_path):
+    run = get_number(os.path.basename(run_path), "run")
+    # directories without a run number go last
+    return (run is None, run or 0, run_path)
 
 
 class biasParser:
-    def __init__(self, bias_dir, kwargs = {}):
+    def __init__(self, bias_dir, kwargs = {}, catalog = None):
+        """
+        catalog : RunCatalog to take the runs from instead of globbing bias_dir
+        The runs are sorted on run number, double_run and window_run compare neighbours in this order
+        """
         self.bias_dir = bias_dir
-        self.run_paths = glob.glob(f"{bias_dir}/run*")
+        if catalog is None:
+            self.run_paths = sorted(glob.glob(f"{bias_dir}/run*"), key = get_run_key)
+        else:
+            self.run_paths = catalog.get_run_paths(station_dir = bias_dir)
         self.function = None
+        self.kwargs = kwargs
+        self.loader = None
+        self.loader_kwargs = {}
+        self.set_executor("serial")
 
-    def set_function(self, function, kwargs):
+    def set_function(self, function, kwargs = {}):
         self.function = function
         self.kwargs = kwargs
 
-    def run(self):
-        results = []
-        for run_path in self.run_paths:
-            result = self.function(run_path)
+    def set_loader(self, loader, kwargs = {}):
+        """
+        loader : function reading the payload of one run (used by window_run), returning None skips the run
+        """
+        self.loader = loader
+        self.loader_kwargs = kwargs
+
+    def set_executor(self, executor = "serial", nr_workers = None, chunksize = 1):
+        """
+        executor : "serial", "thread" (for I/O bound functions) or "process" (for CPU bound functions)
+        nr_workers : number of threads/processes, the executor default if None
+        chunksize : number of runs sent to a process at once (ignored by the other executors)
+        Results are always returned in run order
+        """
+        if executor != "serial" and executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor {executor}, choose from serial, {', '.join(EXECUTORS)}")
+        self.executor = executor
+        self.nr_workers = nr_workers
+        self.chunksize = chunksize
+
+    def _imap(self, function, kwargs, *iterables):
+        """
+        Ordered map of function over the runs, with a parallel executor the runs are handed out in blocks
+        of nr_workers * chunksize so that no more than one block of results is pending at a time
+        """
+        function = partial(function, **kwargs)
+        if self.executor == "serial":
+            yield from map(function, *iterables)
+            return
+
+        items = list(zip(*iterables))
+        block_size = (self.nr_workers or os.cpu_count() or 1) * self.chunksize
+        with EXECUTORS[self.executor](max_workers = self.nr_workers) as executor:
+            for start in range(0, len(items), block_size):
+                block = items[start : start + block_size]
+                yield from executor.map(function, *zip(*block), chunksize = self.chunksize)
+
+    def iter_results(self):
+        """
+        Generator version of run(), results are yielded in run order as soon as they are available
+        so only one result (one block with a parallel executor) is held in memory at a time
+        """
+        for result in self._imap(self.function, self.kwargs, self.run_paths):
             if result is None:
                 continue
-            results.append(result)
-        return results
+            yield result
+
+    def iter_double_results(self):
+        for result in self._imap(self.function, self.kwargs, self.run_paths[:-1], self.run_paths[1:]):
+            if result is None:
+                continue
+            yield result
+
+    def iter_window_results(self, lag = 1):
+        payloads = deque(maxlen = lag + 1)
+        for payload in self._imap(self.loader, self.loader_kwargs, self.run_paths):
+            if payload is None:
+                continue
+            payloads.append(payload)
+            if len(payloads) <= lag:
+                continue
+            result = self.function(payloads[0], payloads[-1], **self.kwargs)
+            if result is None:
+                continue
+            yield result
+
+    def run(self):
+        return list(self.iter_results())
     
     def double_run(self):
-        results = []
-        prev_run_path = self.run_paths[0]
-        for run_path in self.run_paths[1:]:
-            result = self.function(prev_run_path, run_path, **self.kwargs)
-            prev_run_path = run_path
-            if results is None:
-                continue
-            results.append(result)
-        return results
\ No newline at end of file
+        """
+        Calls the function on every pair of adjacent runs (previous run, run),
+        with a parallel executor the pairs are shipped to the workers
+        """
+        return list(self.iter_double_results())
+
+    def window_run(self, lag = 1):
+        """
+        Loads the payload of every run once (with the loader) and calls the function on
+        (payload of the run lag runs earlier, payload of the run), only the last lag + 1 payloads are kept.
+        Runs for which the loader returns None are skipped, with a parallel executor the loading is parallel
+        """
+        return list(self.iter_window_results(lag))
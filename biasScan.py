@@ -0,0 +1,80 @@
+"""
+Access to bias_scan.root through one open file, the ADC values are read in chunks of steps
+so only the requested channels and samples are kept in memory
+"""
+
+import numpy as np
+import uproot
+
+
+# bytes of ADC data read at once (per chunk of steps)
+CHUNK_SIZE = 100 * 1024**2
+
+
+class BiasScan():
+    """
+    vbias (shape [steps, DAC]) and when (shape [steps]) are read when opening,
+    the ADC values (pedestals[24][4096]) only through get_adc and iterate
+    """
+    def __init__(self, path, chunk_size = CHUNK_SIZE) -> None:
+        self.path = path
+        # no array cache, it would keep up to 100 MB of chunks alive
+        self.file = uproot.open(path, array_cache = None)
+        self.tree = self.file["pedestals"]
+        self.adc_branch = self.tree["pedestals[24][4096]"]
+        self.vbias = self.tree["vbias[2]"].array(library = "np")
+        self.when = self.tree["when"].array(library = "np")
+        self.nr_steps = self.tree.num_entries
+        self.nr_channels, self.nr_samples = 24, 4096
+        step_bytes = self.nr_channels * self.nr_samples * np.dtype(np.float32).itemsize
+        self.step_size = max(1, chunk_size // step_bytes)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def get_times(self):
+        return self.when[0], self.when[-1]
+
+    def _get_selection(self, steps, channels, samples):
+        select = lambda nr, selection : np.atleast_1d(np.arange(nr)[slice(None) if selection is None else selection])
+        return select(self.nr_steps, steps), select(self.nr_channels, channels), select(self.nr_samples, samples)
+
+    def iterate(self, steps = None, channels = None, samples = None, dtype = np.float32):
+        """
+        Yields (step indices, adc of shape [steps in chunk, channels, samples]), reading at most step_size steps at once.
+        The chunks come in increasing step order, whatever the order of steps
+        steps : slice, boolean mask or indices of the steps, all if None
+        channels, samples : slice, mask or indices, all if None
+        """
+        steps, channels, samples = self._get_selection(steps, channels, samples)
+        steps = np.sort(steps)
+        if len(steps) == 0:
+            return
+        for range_start in range(steps[0], steps[-1] + 1, self.step_size):
+            range_steps = steps[(range_start <= steps) & (steps < range_start + self.step_size)]
+            if len(range_steps) == 0:
+                continue
+            adc = self.adc_branch.array(entry_start = range_start, entry_stop = range_steps[-1] + 1, library = "np")
+            yield range_steps, adc[range_steps[:, np.newaxis, np.newaxis] - range_start,
+                                   channels[:, np.newaxis], samples].astype(dtype)
+
+    def get_adc(self, steps = None, channels = None, samples = None, dtype = np.float32):
+        """
+        ADC of shape [steps, channels, samples] in the order of steps, see iterate for the arguments.
+        Only the selection is kept, the peak memory is one chunk on top of the result
+        """
+        steps, channels, samples = self._get_selection(steps, channels, samples)
+        adc = np.empty((len(steps), len(channels), len(samples)), dtype = dtype)
+        # iterate reads in increasing step order, order puts the rows back where they were requested
+        order = np.argsort(steps, kind = "stable")
+        position = 0
+        for chunk_steps, chunk in self.iterate(steps[order], channels, samples, dtype):
+            adc[order[position : position + len(chunk)]] = chunk
+            position += len(chunk)
+        return adc
@@ -0,0 +1,104 @@
+"""
+Local cache of bias_scan.root files converted to memory mapped .npy files, so repeated analyses of the same
+bias scan skip the decompression of the pedestals branch.
+The ADC values are stored channel major, shape [channels, samples, steps], so the bias scan of one channel
+and sample is contiguous on disk, vbias and when are stored next to it.
+Entries are keyed as in vcCache (path, size and modification time of the source file). The cache location and
+size cap can be set with the BIAS_CACHE_DIR and BIAS_CACHE_SIZE (bytes) environment variables.
+"""
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from biasScan import BiasScan
+from vcCache import cache_key, evict
+
+
+CACHE_DIR = os.environ.get("BIAS_CACHE_DIR", os.path.expanduser("~/.cache/bias_scans"))
+CACHE_SIZE = int(os.environ.get("BIAS_CACHE_SIZE", 20 * 1024**3))
+CACHE_FIELDS = ["adc", "vbias", "when"]
+
+
+def get_entry(path, cache_dir = None):
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    return os.path.join(cache_dir, cache_key(path))
+
+
+def convert_bias_scan(path, cache_dir = None, cache_size = None, overwrite = False):
+    """
+    Writes the bias scan of path to the cache, reading the ADC values in chunks of steps (see BiasScan),
+    the entry only appears once it is complete
+    returns the entry directory
+    """
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    entry = get_entry(path, cache_dir)
+    if os.path.isdir(entry) and not overwrite:
+        return entry
+    os.makedirs(cache_dir, exist_ok = True)
+
+    tmp_entry = tempfile.mkdtemp(prefix = ".tmp_", dir = cache_dir)
+    try:
+        with BiasScan(path) as bias_scan:
+            np.save(f"{tmp_entry}/vbias.npy", bias_scan.vbias)
+            np.save(f"{tmp_entry}/when.npy", bias_scan.when)
+            adc = np.lib.format.open_memmap(f"{tmp_entry}/adc.npy", mode = "w+", dtype = np.float32,
+                                            shape = (bias_scan.nr_channels, bias_scan.nr_samples, bias_scan.nr_steps))
+            for steps, chunk in bias_scan.iterate():
+                adc[:, :, steps] = np.moveaxis(chunk, 0, -1)
+            adc.flush()
+            del adc
+    except BaseException:
+        shutil.rmtree(tmp_entry, ignore_errors = True)
+        raise
+
+    if overwrite:
+        shutil.rmtree(entry, ignore_errors = True)
+    try:
+        os.rename(tmp_entry, entry)
+    except OSError:
+        # another process converted the same bias scan in the meantime
+        shutil.rmtree(tmp_entry, ignore_errors = True)
+    evict(cache_dir, CACHE_SIZE if cache_size is None else cache_size)
+    return entry
+
+
+def load_bias_scan(path, cache_dir = None, convert = True):
+    """
+    returns a dict with the memory mapped adc (shape [channels, samples, steps]), vbias and when of path,
+    converting the bias scan first if it is not cached (None if convert is False)
+    """
+    entry = get_entry(path, cache_dir)
+    if not os.path.isdir(entry):
+        if not convert:
+            return None
+        entry = convert_bias_scan(path, cache_dir)
+    data = {field : np.load(f"{entry}/{field}.npy", mmap_mode = "r") for field in CACHE_FIELDS}
+    # the modification time of an entry is its last use
+    os.utime(entry)
+    return data
+
+
+def unpack_cached_vbias(path, cache_dir = None):
+    return load_bias_scan(path, cache_dir)["vbias"]
+
+
+def unpack_cached_time(path, cache_dir = None):
+    return load_bias_scan(path, cache_dir)["when"]
+
+
+def unpack_cached_adc(path, channels = None, samples = None, cache_dir = None):
+    """
+    ADC of path with shape [channels, samples, steps], read only memory mapped.
+    channels, samples : index, slice or list, all if None.
+    Integers and slices return views of the cache without copying, lists are copied on indexing
+    """
+    adc = load_bias_scan(path, cache_dir)["adc"]
+    channels = slice(None) if channels is None else channels
+    samples = slice(None) if samples is None else samples
+    if np.ndim(channels) and np.ndim(samples):
+        # two index lists select all their combinations, not pairs
+        return adc[np.ix_(channels, samples)]
+    return adc[channels, samples]
@@ -0,0 +1,172 @@
+"""
+Catalog of voltage calibration files, to look up which calibration applies at a given time
+"""
+
+import os
+import re
+import glob
+import json
+import bisect
+
+import numpy as np
+import uproot
+
+
+def get_times_from_filename(filename):
+    """
+    assumes filename to be of the form volCalConsts_pol9_s{station}_{start_time}-{end_time}.root
+    """
+    times = os.path.basename(filename).split("_")[-1]
+    start_time, end_time = times.split(".")[0].split("-")
+    return int(start_time), int(end_time)
+
+
+def get_station_from_filename(filename):
+    match = re.search(r"_s(\d+)_", os.path.basename(filename))
+    return None if match is None else int(match.group(1))
+
+
+def get_times_from_file(path):
+    with uproot.open(path) as f:
+        start_time = f["general_tree/startTime"].array(library = "np")[0]
+        end_time = f["general_tree/endTime"].array(library = "np")[0]
+    return int(start_time), int(end_time)
+
+
+class CalibrationCatalog():
+    """
+    Index of VC files per station, sorted on (start time, end time) of the scan.
+    Single time queries use bisect, arrays of event times are looked up with np.searchsorted,
+    both are O(log n) per query
+    """
+    def __init__(self, entries = None) -> None:
+        self.entries = {}
+        # per station array of [start time, end time], rebuilt after an add
+        self._times = {}
+        for entry in [] if entries is None else entries:
+            self.add(entry["path"], entry["station"], (entry["start_time"], entry["end_time"]))
+
+    @classmethod
+    def from_directory(cls, bias_dir, stations, include_2022 = True, use_filename = True):
+        """
+        Indexes the VC files of the stations in bias_dir (same layout as the analysis scripts),
+        use_filename : take the times from the filename instead of opening the general_tree of every file
+        """
+        catalog = cls()
+        catalog.update(bias_dir, stations, include_2022 = include_2022, use_filename = use_filename)
+        return catalog
+
+    @classmethod
+    def load(cls, catalog_path):
+        with open(catalog_path, "r") as catalog_file:
+            return cls(json.load(catalog_file))
+
+    def save(self, catalog_path):
+        tmp_path = f"{catalog_path}.tmp"
+        with open(tmp_path, "w") as catalog_file:
+            json.dump(self.to_list(), catalog_file)
+        os.replace(tmp_path, catalog_path)
+
+    def to_list(self):
+        return [dict(station = station, start_time = start_time, end_time = end_time, path = path)
+                for station, station_entries in self.entries.items()
+                for start_time, end_time, path in station_entries]
+
+    def update(self, bias_dir, stations, include_2022 = True, use_filename = True):
+        """
+        Adds the VC files that are not in the catalog yet, returns the number of files added
+        """
+        known_paths = set(entry["path"] for entry in self.to_list())
+        nr_added = 0
+        for station in stations:
+            vc_files = glob.glob(f"{bias_dir}/station{station}/run*/vol*")
+            if include_2022:
+                vc_files += glob.glob(f"{bias_dir}/season22_scan_testing/station{station}/vol*s{station}*")
+            for vc_file in vc_files:
+                if vc_file in known_paths:
+                    continue
+                times = get_times_from_filename(vc_file) if use_filename else get_times_from_file(vc_file)
+                self.add(vc_file, station, times)
+                nr_added += 1
+        return nr_added
+
+    def add(self, path, station = None, times = None):
+        station = get_station_from_filename(path) if station is None else station
+        times = get_times_from_filename(path) if times is None else times
+        station_entries = self.entries.setdefault(int(station), [])
+        bisect.insort(station_entries, (int(times[0]), int(times[1]), path))
+        self._times.pop(int(station), None)
+
+    def get_paths(self, station):
+        return [entry[2] for entry in self.entries.get(int(station), [])]
+
+    def get_times(self, station):
+        """
+        start and end times of the calibrations of station, shape [calibrations, 2]
+        """
+        station = int(station)
+        if station not in self._times:
+            self._times[station] = np.array([entry[:2] for entry in self.entries.get(station, [])],
+                                            dtype = np.int64).reshape(-1, 2)
+        return self._times[station]
+
+    def _start_times(self, station):
+        return self.get_times(station)[:, 0]
+
+    def previous(self, station, t):
+        """
+        The last calibration that started at or before t, None if there is none
+        """
+        idx = bisect.bisect_right(self._start_times(station), t) - 1
+        return None if idx < 0 else self.entries[int(station)][idx][2]
+
+    def next(self, station, t):
+        """
+        The first calibration that started after t, None if there is none
+        """
+        start_times = self._start_times(station)
+        idx = bisect.bisect_right(start_times, t)
+        return None if idx == len(start_times) else self.entries[int(station)][idx][2]
+
+    def covering(self, station, t):
+        """
+        The calibration whose scan covers t (start time <= t <= end time), None if t falls between scans
+        """
+        idx = bisect.bisect_right(self._start_times(station), t) - 1
+        if idx < 0 or self.entries[int(station)][idx][1] < t:
+            return None
+        return self.entries[int(station)][idx][2]
+
+    def nearest(self, station, t):
+        """
+        The calibration with the scan closest in time to t
+        """
+        idx = self.lookup(station, [t], mode = "nearest")[0]
+        return None if idx < 0 else self.entries[int(station)][idx][2]
+
+    def lookup(self, station, times, mode = "previous"):
+        """
+        Batched query for an array of (event) times
+        mode : "previous", "next", "covering" or "nearest", see the single time methods
+        returns the index into get_paths(station) per time, -1 where there is no calibration
+        """
+        times = np.asarray(times)
+        scan_times = self.get_times(station)
+        if len(scan_times) == 0:
+            return np.full(times.shape, -1)
+
+        after = np.searchsorted(scan_times[:, 0], times, side = "right")
+        previous = after - 1
+        if mode == "previous":
+            return previous
+        if mode == "next":
+            return np.where(after < len(scan_times), after, -1)
+        if mode == "covering":
+            covered = (previous >= 0) & (times <= scan_times[np.maximum(previous, 0), 1])
+            return np.where(covered, previous, -1)
+        if mode == "nearest":
+            # distance to the scan interval, 0 inside of it
+            distance_previous = np.where(previous >= 0, times - scan_times[np.maximum(previous, 0), 1], np.inf)
+            distance_next = np.where(after < len(scan_times), scan_times[np.minimum(after, len(scan_times) - 1), 0] - times, np.inf)
+            return np.where(np.maximum(distance_previous, 0) <= distance_next, previous, after)
+        raise ValueError(f"Unknown lookup mode {mode}")
@@ -0,0 +1,86 @@
+"""
+Pipeline stage that applies a voltage calibration to raw RNO-G waveforms in bulk
+"""
+
+import time
+
+import numpy as np
+import uproot
+
+
+class CalibrationStage():
+    """
+    Reads raw ADC waveforms and their starting windows in chunks of events with uproot
+    and yields the calibrated voltages chunk by chunk, so memory is bounded by step_size.
+    The tree and branch names can be changed to match the files that are read,
+    the starting windows are either one per event [events] or one per channel [events, channels].
+    If an InverseTable is given it is used instead of the exact (iterative) inversion.
+    """
+    def __init__(self, vc, step_size = 100, tree = "waveforms",
+                 adc_branch = "radiant_data[24][2048]", window_branch = "start_window",
+                 inverse_table = None, **solver_kwargs) -> None:
+        self.vc = vc
+        self.step_size = step_size
+        self.tree = tree
+        self.adc_branch = adc_branch
+        self.window_branch = window_branch
+        self.inverse_table = inverse_table
+        self.solver_kwargs = solver_kwargs
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.nr_events = 0
+        self.nr_samples = 0
+        self.nr_not_converged = 0
+        self.processing_time = 0.
+
+    def throughput(self):
+        """
+        Calibrated events per second, only counting the time spent inside the stage (reading + calibrating)
+        """
+        if self.processing_time == 0:
+            return 0.
+        return self.nr_events / self.processing_time
+
+    def calibrate(self, adc, starting_window):
+        """
+        adc : shape [events, channels, samples]
+        starting_window : shape [events] or [events, channels]
+        """
+        starting_window = np.asarray(starting_window)
+        if starting_window.ndim == 1:
+            return self._calibrate(adc, starting_window, np.arange(adc.shape[1]))
+
+        v = np.empty(adc.shape)
+        for ch in range(adc.shape[1]):
+            v[:, ch : ch + 1] = self._calibrate(adc[:, ch : ch + 1], starting_window[:, ch], [ch])
+        return v
+
+    def _calibrate(self, adc, starting_window, channels):
+        if self.inverse_table is not None:
+            return self.inverse_table.adc_to_v(adc, starting_window, channels = channels)
+        v, converged = self.vc.adc_to_v(adc, starting_window, channels = channels, **self.solver_kwargs)
+        self.nr_not_converged += np.count_nonzero(~converged)
+        return v
+
+    def iterate(self, paths):
+        """
+        Generator yielding the calibrated voltages, shape [events, channels, samples], per chunk of events
+        paths : one or more ROOT files containing self.tree
+        """
+        if isinstance(paths, str):
+            paths = [paths]
+        files = {path : self.tree for path in paths}
+
+        start = time.perf_counter()
+        for arrays in uproot.iterate(files, [self.adc_branch, self.window_branch],
+                                     step_size = self.step_size, library = "np"):
+            adc = arrays[self.adc_branch]
+            v = self.calibrate(adc, arrays[self.window_branch])
+            self.nr_events += len(adc)
+            self.nr_samples += adc.size
+            self.processing_time += time.perf_counter() - start
+
+            yield v
+            # time spent by the consumer is not counted
+            start = time.perf_counter()
@@ -0,0 +1,74 @@
+"""
+Single pass over the VC files of a station computing the drifts of vc_drift_with_ref.py, vc_drift_no_ref.py
+and the moving difference of moving_diff_vc.py together (on the files of the pass, not one file per run),
+every calibration is read and evaluated only once
+"""
+
+from collections import deque
+
+import numpy as np
+
+from voltageCalibration import voltageCalibration
+
+
+def get_vc_diff(vc_0, vc_1):
+    return np.mean(np.abs(vc_1 - vc_0), axis = -1)
+
+
+class DriftEngine():
+    """
+    v_range : grid of the reference and consecutive drifts (all channels and samples, float32 as in the scripts)
+    vc_ref_file : calibration all scans are compared to, the first file of the pass if None
+    lags : scan lags of the moving difference, evaluated for lag_channel on lag_v (float64 as in moving_diff_vc.py)
+    After run() the results are in
+        times, ref_diffs : start time and mean |adc - adc_ref| of shape [channels, samples] per scan
+        prev_times, prev_diffs : the same for the difference to the previous scan (from the second scan on)
+        lag_results : per lag a list of (start time of the earlier scan, mean |diff|, std |diff|)
+    """
+    def __init__(self, v_range, vc_ref_file = None, lags = (1,), lag_channel = 0,
+                 lag_v = np.arange(-1.29, 0.69, 0.1)) -> None:
+        self.v_range = v_range
+        self.vc_ref_file = vc_ref_file
+        self.lags = sorted(set(lags))
+        self.lag_channel = lag_channel
+        self.lag_v = lag_v
+
+    def evaluate(self, vc_file):
+        vc = voltageCalibration(vc_file)
+        adc = vc.get_fit_curves(self.v_range)
+        adc_lag = vc.get_fit_curves(self.lag_v, channels = self.lag_channel, dtype = np.float64)[0]
+        return vc.get_times()[0], adc, adc_lag
+
+    def run(self, vc_files, verbose = True):
+        vc_ref_file = vc_files[0] if self.vc_ref_file is None else self.vc_ref_file
+        # the reference only needs a separate evaluation when it is not the first scan of the pass
+        adc_ref = None if vc_ref_file == vc_files[0] else self.evaluate(vc_ref_file)[1]
+
+        self.times, self.ref_diffs = [], []
+        self.prev_times, self.prev_diffs = [], []
+        self.lag_results = {lag : [] for lag in self.lags}
+        # (time, adc_lag) of the last max(lags) scans
+        history = deque(maxlen = max(self.lags, default = 0))
+        adc_prev = None
+        for i, vc_file in enumerate(vc_files):
+            if verbose:
+                print(f"vc {i}/{len(vc_files) - 1}")
+            time, adc, adc_lag = self.evaluate(vc_file)
+            if adc_ref is None:
+                adc_ref = adc
+
+            self.times.append(time)
+            self.ref_diffs.append(get_vc_diff(adc_ref, adc))
+            if adc_prev is not None:
+                self.prev_times.append(time)
+                self.prev_diffs.append(get_vc_diff(adc_prev, adc))
+            adc_prev = adc
+
+            for lag in self.lags:
+                if len(history) < lag:
+                    continue
+                time_0, adc_lag_0 = history[-lag]
+                vc_diff = np.abs(adc_lag - adc_lag_0)
+                self.lag_results[lag].append((time_0, np.mean(vc_diff), np.std(vc_diff)))
+            history.append((time, adc_lag))
+        return self
@@ -0,0 +1,70 @@
+"""
+Evaluation plans for calibration curves on a fixed voltage grid.
+Scripts evaluate many calibrations on the same grid, so the monomial powers
+and the residual interpolation weights only have to be computed once.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+PLAN_CACHE_SIZE = 32
+
+
+class EvaluationPlan():
+    """
+    Power matrix and residual interpolation weights for one voltage grid and one DAC
+    """
+    def __init__(self, v, vres, order = 10) -> None:
+        self.v = np.array(v, dtype = np.float64)
+        self.vres = np.array(vres, dtype = np.float64)
+        self.order = order
+
+        # shape [order, points] so that coeffs @ powers gives [..., points]
+        self.powers = np.ascontiguousarray((self.v[:, np.newaxis] ** np.arange(order)).T)
+
+        # same binning as make_vc_curve, the outer segments are extrapolated
+        self.res_idx = np.clip(np.searchsorted(self.vres, self.v, side = "right"), 1, len(self.vres) - 1)
+        self.res_weight = (self.v - self.vres[self.res_idx - 1]) / (self.vres[self.res_idx] - self.vres[self.res_idx - 1])
+
+    def interpolate_residual(self, res):
+        return (1. - self.res_weight) * res[self.res_idx - 1] + self.res_weight * res[self.res_idx]
+
+    def evaluate(self, coeffs, res, out = None):
+        """
+        coeffs : shape [..., order]
+        res : residual values belonging to the vres of this plan
+        returns array of shape [..., points]
+        """
+        adc = np.matmul(coeffs, self.powers, dtype = np.float64)
+        adc += self.interpolate_residual(res)
+        if out is None:
+            return adc
+        out[...] = adc
+        return out
+
+
+_plan_cache = OrderedDict()
+
+def get_evaluation_plan(v, vres, order = 10):
+    """
+    Returns the (memoized) plan for this grid, the cache keeps the PLAN_CACHE_SIZE most recently used plans
+    """
+    v = np.ascontiguousarray(v, dtype = np.float64)
+    vres = np.ascontiguousarray(vres, dtype = np.float64)
+    key = (v.tobytes(), vres.tobytes(), order)
+    plan = _plan_cache.get(key)
+    if plan is not None:
+        _plan_cache.move_to_end(key)
+        return plan
+
+    plan = EvaluationPlan(v, vres, order = order)
+    _plan_cache[key] = plan
+    while len(_plan_cache) > PLAN_CACHE_SIZE:
+        _plan_cache.popitem(last = False)
+    return plan
+
+
+def clear_plan_cache():
+    _plan_cache.clear()
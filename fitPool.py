@@ -0,0 +1,201 @@
+"""
+Pool of subprocess workers for batch fitting with perform_fit (utility_functions_withROOT).
+The ROOT/mattak objects leak memory, so workers are recycled after max_tasks fits or when their memory grows
+above max_memory. A fit that runs longer than timeout or crosses max_memory while running is killed together
+with its worker and retried in a fresh worker. Every fit runs in its own scratch directory and its output is
+moved into place with os.replace, so a killed fit never leaves a partial VC file behind.
+"""
+
+import os
+import glob
+import time
+import shutil
+import tempfile
+import multiprocessing as mp
+from collections import deque
+from multiprocessing.connection import wait
+
+from utility_functions import cwd
+
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def get_rss(pid):
+    """
+    Resident memory of process pid in bytes, None where /proc is not available
+    """
+    try:
+        with open(f"/proc/{pid}/statm", "r") as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def fit_task(bias_path, out_dir = None, ref = 1.5):
+    """
+    Runs perform_fit on bias_path in a scratch directory and moves the VC file(s) to out_dir
+    (the directory of the bias scan if None), returns the paths of the VC files
+    """
+    # imported here so that only the workers need ROOT and librno-g
+    from utility_functions_withROOT import perform_fit
+
+    out_dir = os.path.dirname(os.path.abspath(bias_path)) if out_dir is None else out_dir
+    os.makedirs(out_dir, exist_ok = True)
+    # on the same filesystem as out_dir, so the move is a rename
+    tmp_dir = tempfile.mkdtemp(prefix = ".tmp_fit_", dir = out_dir)
+    try:
+        # saveFitCoeffsInFile writes to the working directory
+        with cwd(tmp_dir):
+            perform_fit(os.path.abspath(bias_path), ref)
+        if len(glob.glob(f"{tmp_dir}/*.root")) == 0:
+            raise RuntimeError(f"perform_fit wrote no VC file for {bias_path}")
+        vc_paths = []
+        for tmp_path in glob.glob(f"{tmp_dir}/*.root"):
+            vc_path = os.path.join(out_dir, os.path.basename(tmp_path))
+            os.replace(tmp_path, vc_path)
+            vc_paths.append(vc_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors = True)
+    return vc_paths
+
+
+def worker_loop(conn, function, max_tasks):
+    """
+    Runs tasks received over conn until max_tasks are done or None is received,
+    a ready message is sent first so the timeout of the first task does not include the startup of the worker
+    """
+    conn.send(("ready", None, get_rss(os.getpid())))
+    for _ in range(max_tasks):
+        task = conn.recv()
+        if task is None:
+            break
+        try:
+            conn.send(("ok", function(*task), get_rss(os.getpid())))
+        except Exception as error:
+            conn.send(("error", repr(error), get_rss(os.getpid())))
+    conn.close()
+
+
+class FitPool():
+    """
+    function : module level function called as function(*task) in the workers
+    nr_workers : number of worker processes
+    max_tasks : number of tasks after which a worker is replaced
+    max_memory : resident memory (bytes) above which a worker is replaced, or killed when it is running a task
+    timeout : seconds after which a running task is killed, counted from the moment the worker is ready
+              (spawned and fitPool imported). Imports done inside function, such as ROOT in fit_task,
+              count towards the first task of every worker
+    retries : number of times a failed, killed or timed out task is tried again
+    """
+    def __init__(self, function = fit_task, nr_workers = None, max_tasks = 10, max_memory = None, timeout = None,
+                 retries = 1, poll_interval = 1.) -> None:
+        self.function = function
+        self.nr_workers = (os.cpu_count() or 1) if nr_workers is None else nr_workers
+        self.max_tasks = max_tasks
+        self.max_memory = max_memory
+        self.timeout = timeout
+        self.retries = retries
+        self.poll_interval = poll_interval
+        # a fresh interpreter per worker, nothing of ROOT is inherited from the parent
+        self.context = mp.get_context("spawn")
+
+    def _start_worker(self):
+        conn, worker_conn = self.context.Pipe()
+        process = self.context.Process(target = worker_loop, args = (worker_conn, self.function, self.max_tasks),
+                                       daemon = True)
+        process.start()
+        worker_conn.close()
+        return dict(process = process, conn = conn, task = None, started = None, nr_done = 0, ready = False)
+
+    def _stop_worker(self, worker, kill = False):
+        if kill:
+            worker["process"].kill()
+        elif worker["process"].is_alive() and worker["nr_done"] < self.max_tasks:
+            try:
+                worker["conn"].send(None)
+            except OSError:
+                pass
+        worker["process"].join()
+        worker["conn"].close()
+
+    def run(self, tasks, verbose = True):
+        """
+        tasks : list of argument tuples
+        returns (results, failures), dicts from the task index to the result and to the last error
+        """
+        pending = deque((i, tuple(task), 0) for i, task in enumerate(tasks))
+        results, failures = {}, {}
+        workers = [None] * self.nr_workers
+
+        def fail(task, error):
+            idx, args, attempt = task
+            if attempt < self.retries:
+                pending.append((idx, args, attempt + 1))
+            else:
+                failures[idx] = error
+            if verbose:
+                print(f"task {idx} {args} failed (attempt {attempt + 1}): {error}")
+
+        while pending or any(worker is not None and worker["task"] is not None for worker in workers):
+            for slot, worker in enumerate(workers):
+                if worker is not None and worker["task"] is None and not worker["process"].is_alive():
+                    self._stop_worker(worker)
+                    workers[slot] = worker = None
+                if pending and (worker is None or worker["task"] is None):
+                    if worker is None:
+                        workers[slot] = worker = self._start_worker()
+                    worker["task"] = pending.popleft()
+                    # a new worker starts the clock with its ready message
+                    worker["started"] = time.monotonic() if worker["ready"] else None
+                    worker["conn"].send(worker["task"][1])
+
+            busy = [worker for worker in workers if worker is not None and worker["task"] is not None]
+            ready = wait([worker["conn"] for worker in busy], timeout = self.poll_interval)
+            for slot, worker in enumerate(workers):
+                if worker is None or worker["task"] is None:
+                    continue
+                task = worker["task"]
+                if worker["conn"] in ready:
+                    try:
+                        status, result, rss = worker["conn"].recv()
+                    except (EOFError, OSError):
+                        # the worker died during the task (e.g. a segfault in ROOT)
+                        self._stop_worker(worker, kill = True)
+                        workers[slot] = None
+                        fail(task, f"worker exited with code {worker['process'].exitcode}")
+                        continue
+                    if status == "ready":
+                        worker["ready"] = True
+                        worker["started"] = time.monotonic()
+                        continue
+                    worker["task"] = None
+                    worker["nr_done"] += 1
+                    if status == "ok":
+                        results[task[0]] = result
+                        if verbose:
+                            print(f"task {task[0]} done: {result}")
+                    else:
+                        fail(task, result)
+                    if worker["nr_done"] >= self.max_tasks or (self.max_memory is not None and rss is not None
+                                                                and rss > self.max_memory):
+                        self._stop_worker(worker)
+                        workers[slot] = None
+                    continue
+
+                if (self.timeout is not None and worker["started"] is not None
+                        and time.monotonic() - worker["started"] > self.timeout):
+                    error = f"timed out after {self.timeout} s"
+                else:
+                    rss = get_rss(worker["process"].pid)
+                    if self.max_memory is None or rss is None or rss <= self.max_memory:
+                        continue
+                    error = f"using {rss / 1024**2:.0f} MB"
+                self._stop_worker(worker, kill = True)
+                workers[slot] = None
+                fail(task, error)
+
+        for worker in workers:
+            if worker is not None:
+                self._stop_worker(worker)
+        return results, failures
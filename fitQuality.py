@@ -0,0 +1,51 @@
+"""
+Quality of the fit of every (channel, sample) of a VC file with respect to its own bias scan.
+The calibration curves are evaluated at the bias steps within the fit range and compared to the measured ADC,
+both in the pedestal referenced frame of the fit, for all channels and samples at once.
+"""
+
+import numpy as np
+
+from vcFit import get_fit_range
+from utility_functions import rescale_adc
+
+
+def fit_quality(vbias, adc, vc, v_ref = 1.5, fit_min = 0.2, fit_max = 2.2, sigma = None):
+    """
+    vbias : shape [steps, DAC], adc : shape [steps, channels, samples] as in bias_scan.root
+    vc : voltageCalibration of the bias scan
+    sigma : ADC noise per step for the chi2, per DAC the median RMS of all samples if None
+            (the bias scans do not store uncertainties, so the chi2 is then relative to a typical sample)
+    returns a dict with maps of shape [channels, samples]:
+        chi2 (per degree of freedom), rms and max_residual (largest absolute residual), and the number of points
+    """
+    nr_channels, nr_samples = adc.shape[1:]
+    order = vc.coeffs.shape[-1]
+    quality = dict(chi2 = np.empty((nr_channels, nr_samples)), rms = np.empty((nr_channels, nr_samples)),
+                   max_residual = np.empty((nr_channels, nr_samples)), nr_points = np.zeros(2, dtype = int))
+    for dac in range(2):
+        channels = np.flatnonzero((np.arange(nr_channels) > 11) == dac)
+        v, in_range = get_fit_range(vbias, v_ref, fit_min, fit_max, dac)
+        # shape [channels, samples, points] as the calibration curves
+        adc_dac = np.moveaxis(rescale_adc(vbias, adc[:, channels], v_ref, dac)[in_range], 0, -1)
+        residuals = adc_dac - vc.get_fit_curves(v[in_range], channels = channels, dtype = np.float64)
+
+        sum_squares = np.sum(residuals**2, axis = -1)
+        rms = np.sqrt(sum_squares / np.sum(in_range))
+        dac_sigma = np.median(rms) if sigma is None else sigma
+        quality["chi2"][channels] = sum_squares / (dac_sigma**2 * (np.sum(in_range) - order))
+        quality["rms"][channels] = rms
+        quality["max_residual"][channels] = np.max(np.abs(residuals), axis = -1)
+        quality["nr_points"][dac] = np.sum(in_range)
+    return quality
+
+
+def flag_samples(quality, max_chi2 = 5., max_residual = None):
+    """
+    (channel, sample) pairs, shape [flagged, 2], with a chi2 above max_chi2, a residual above max_residual
+    or a non finite fit
+    """
+    bad = ~np.isfinite(quality["chi2"]) | (quality["chi2"] > max_chi2)
+    if max_residual is not None:
+        bad |= quality["max_residual"] > max_residual
+    return np.argwhere(bad)
@@ -0,0 +1,133 @@
+"""
+Deviation of bias scans and calibration curves from the ideal linear ADC (adc = v * 4095/2.5),
+shared by bias_dev_from_linearity.py, vc_dev_from_linearity.py and mean_dev_from_linearity_over_run.py
+"""
+
+import numpy as np
+from numba import jit, prange
+
+
+V_TO_ADC = 4095 / 2.5
+# bias voltage of the pedestal when no pedestal file is used
+V_REF = 1.5
+
+
+def get_dacs(channels):
+    return (np.asarray(channels) > 11).astype(int)
+
+
+def align_to_pedestal(vbias, v_ped = V_REF, adc = None, channels = None):
+    """
+    Shifts vbias (shape [steps, DAC]) to the pedestal voltage v_ped (scalar or per DAC).
+    If adc (shape [steps, channels, samples]) is given, the ADC of the step closest to the pedestal
+    is subtracted from every step as well
+    channels : channel numbers of the channel axis of adc, range(adc.shape[1]) if None
+    returns vbias (and adc)
+    """
+    v_ped = np.broadcast_to(v_ped, (2,))
+    if adc is None:
+        return vbias - v_ped
+    channels = np.arange(adc.shape[1]) if channels is None else np.asarray(channels)
+    v_ped_idx = np.argmin(np.abs(vbias - v_ped), axis = 0)
+    adc_ped = adc[v_ped_idx[get_dacs(channels)], np.arange(adc.shape[1])]
+    return vbias - v_ped, adc - adc_ped
+
+
+def select_window(vbias, v_min, v_max):
+    """
+    Steps with v_min < vbias < v_max per DAC, shape [points, DAC]. Both DACs have to keep the same number of steps
+    """
+    in_window = (v_min < vbias) & (vbias < v_max)
+    nr_points = np.sum(in_window, axis = 0)
+    if nr_points[0] != nr_points[1]:
+        raise ValueError(f"The DACs have a different number of steps in ({v_min}, {v_max}): {nr_points}")
+    return np.stack([vbias[in_window[:, dac], dac] for dac in range(2)], axis = -1)
+
+
+@jit(nopython = True, parallel = True)
+def deviation_stats_over_samples(adc, linear, out):
+    """
+    adc : shape [channels, samples, steps], linear : shape [channels, steps]
+    out : shape [4, channels, steps], mean, std, mean of abs and std of abs over the samples
+    """
+    nr_channels, nr_samples, nr_steps = adc.shape
+    for ch in prange(nr_channels):
+        for step in range(nr_steps):
+            total = 0.
+            total_abs = 0.
+            for s in range(nr_samples):
+                delta = adc[ch, s, step] - linear[ch, step]
+                total += delta
+                total_abs += abs(delta)
+            mean = total / nr_samples
+            mean_abs = total_abs / nr_samples
+            var = 0.
+            var_abs = 0.
+            for s in range(nr_samples):
+                delta = adc[ch, s, step] - linear[ch, step]
+                var += (delta - mean)**2
+                var_abs += (abs(delta) - mean_abs)**2
+            out[0, ch, step] = mean
+            out[1, ch, step] = np.sqrt(var / nr_samples)
+            out[2, ch, step] = mean_abs
+            out[3, ch, step] = np.sqrt(var_abs / nr_samples)
+
+
+@jit(nopython = True, parallel = True)
+def deviation_stats_over_steps(adc, linear, out):
+    """
+    adc : shape [channels, samples, steps], linear : shape [channels, steps]
+    out : shape [4, channels, samples], mean, std, mean of abs and std of abs over the steps
+    """
+    nr_channels, nr_samples, nr_steps = adc.shape
+    for i in prange(nr_channels * nr_samples):
+        ch = i // nr_samples
+        s = i % nr_samples
+        total = 0.
+        total_abs = 0.
+        for step in range(nr_steps):
+            delta = adc[ch, s, step] - linear[ch, step]
+            total += delta
+            total_abs += abs(delta)
+        mean = total / nr_steps
+        mean_abs = total_abs / nr_steps
+        var = 0.
+        var_abs = 0.
+        for step in range(nr_steps):
+            delta = adc[ch, s, step] - linear[ch, step]
+            var += (delta - mean)**2
+            var_abs += (abs(delta) - mean_abs)**2
+        out[0, ch, s] = mean
+        out[1, ch, s] = np.sqrt(var / nr_steps)
+        out[2, ch, s] = mean_abs
+        out[3, ch, s] = np.sqrt(var_abs / nr_steps)
+
+
+def linearity_deviation(adc, vbias, channels, axis = "samples", use_numba = False, v_to_adc = V_TO_ADC):
+    """
+    Statistics of adc - vbias * v_to_adc in one pass over all channels and samples
+    adc : shape [channels, samples, steps], e.g. voltageCalibration.get_fit_curves(vbias, channels)
+          or np.moveaxis(bias scan adc, 0, -1) for a bias scan
+    vbias : shape [steps, DAC]
+    channels : channel numbers of the channel axis of adc, to select the DAC
+    axis : reduce over the "samples" (returns [channels, steps]) or over the "steps" (returns [channels, samples])
+    use_numba : reduce with the parallel numba kernels instead of a broadcast numpy expression,
+                which avoids the [channels, samples, steps] temporaries
+    returns dict with mean, std, abs_mean and abs_std
+    """
+    linear = (vbias * v_to_adc)[:, get_dacs(channels)].T
+    if axis not in ["samples", "steps"]:
+        raise ValueError(f"Unknown axis {axis}, choose samples or steps")
+
+    if use_numba:
+        shape = (4, adc.shape[0], adc.shape[1] if axis == "steps" else adc.shape[2])
+        stats = np.empty(shape)
+        kernel = deviation_stats_over_samples if axis == "samples" else deviation_stats_over_steps
+        kernel(adc, np.ascontiguousarray(linear, dtype = np.float64), stats)
+        return dict(mean = stats[0], std = stats[1], abs_mean = stats[2], abs_std = stats[3])
+
+    delta = adc - linear[:, np.newaxis, :]
+    reduce_axis = 1 if axis == "samples" else 2
+    abs_delta = np.abs(delta)
+    return dict(mean = np.mean(delta, axis = reduce_axis), std = np.std(delta, axis = reduce_axis),
+                abs_mean = np.mean(abs_delta, axis = reduce_axis), abs_std = np.std(abs_delta, axis = reduce_axis))
@@ -0,0 +1,176 @@
+"""
+Pairwise drift matrix between all calibrations of a station.
+The N x N matrix is computed in tiles of block_size x block_size calibrations, sized so that the curves of
+two blocks fit in the memory budget. Every tile is written to its own file when it is done, so an interrupted
+computation continues with the missing tiles, and tiles can be computed in parallel.
+A manifest in the tile directory records the block size and the inputs of the tiles, tiles of another
+configuration (other memory budget, VC files or grid) are removed instead of being reused.
+"""
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+from voltageCalibration import voltageCalibration, NR_CHANNELS
+from biasParser import EXECUTORS
+
+
+class PairwiseDrift():
+    """
+    vc_files : calibrations of the matrix, in matrix order
+    v_range : voltage grid the curves are compared on
+    out_dir : directory of the tile files
+    memory_budget : bytes available for the curves, temporaries and results of one tile (per worker)
+    per_sample : also keep the mean |diff| per sample, [N, N, channels, samples] (large)
+    The matrix entries are get_vc_diff (mean |adc_1 - adc_0| over v_range) averaged over the samples ("mean")
+    and the largest per sample value ("max"), both per channel
+    """
+    def __init__(self, vc_files, v_range, out_dir, memory_budget = 2 * 1024**3, per_sample = False,
+                 nr_samples = 4096) -> None:
+        self.vc_files = list(vc_files)
+        self.v_range = np.asarray(v_range)
+        self.out_dir = out_dir
+        self.per_sample = per_sample
+        self.nr_samples = nr_samples
+        self.block_size = self.get_block_size(memory_budget)
+        self.nr_blocks = -(-len(self.vc_files) // self.block_size)
+        os.makedirs(f"{out_dir}/tiles", exist_ok = True)
+        self.check_manifest()
+
+    def get_block_size(self, memory_budget):
+        """
+        Largest block size whose tile fits in memory_budget: two blocks of curves, the difference of one
+        calibration with a block (reduced in place), the per channel results of a row and, with per_sample,
+        the [block, block, channels, samples] array of the tile
+        """
+        itemsize = np.dtype(np.float32).itemsize
+        row_size = NR_CHANNELS * self.nr_samples * itemsize
+        curve_size = row_size * len(self.v_range)
+        block_size = max(1, min(len(self.vc_files), memory_budget // (3 * curve_size + row_size)))
+        if self.per_sample:
+            while block_size > 1 and 3 * block_size * curve_size + (block_size + 1) * block_size * row_size > memory_budget:
+                block_size -= 1
+        return int(block_size)
+
+    def get_manifest(self):
+        inputs = hashlib.sha1("\n".join(os.path.abspath(vc_file) for vc_file in self.vc_files).encode())
+        inputs.update(np.ascontiguousarray(self.v_range, dtype = np.float64).tobytes())
+        return dict(block_size = self.block_size, nr_files = len(self.vc_files), nr_samples = self.nr_samples,
+                    per_sample = self.per_sample, inputs = inputs.hexdigest())
+
+    def check_manifest(self):
+        """
+        Removes the tiles of another configuration and writes the manifest of this one
+        """
+        manifest_path = f"{self.out_dir}/tiles/manifest.json"
+        manifest = self.get_manifest()
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as manifest_file:
+                if json.load(manifest_file) == manifest:
+                    return
+        stale = [name for name in os.listdir(f"{self.out_dir}/tiles") if name.startswith("tile_")]
+        if len(stale) > 0:
+            print(f"Removing {len(stale)} tiles of another configuration")
+        for name in stale:
+            os.remove(f"{self.out_dir}/tiles/{name}")
+        with open(f"{manifest_path}.tmp", "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    @property
+    def tiles(self):
+        """
+        Upper triangle (diagonal included) of the block matrix, the lower triangle follows from symmetry
+        """
+        return [(i, j) for i in range(self.nr_blocks) for j in range(i, self.nr_blocks)]
+
+    def get_block(self, block):
+        return slice(block * self.block_size, min((block + 1) * self.block_size, len(self.vc_files)))
+
+    def get_tile_path(self, tile):
+        return f"{self.out_dir}/tiles/tile_{tile[0]}_{tile[1]}.npz"
+
+    def missing_tiles(self):
+        return [tile for tile in self.tiles if not os.path.exists(self.get_tile_path(tile))]
+
+    def load_curves(self, block):
+        vc_files = self.vc_files[self.get_block(block)]
+        curves = np.empty((len(vc_files), NR_CHANNELS, self.nr_samples, len(self.v_range)), dtype = np.float32)
+        for i, vc_file in enumerate(vc_files):
+            curves[i] = voltageCalibration(vc_file).get_fit_curves(self.v_range)
+        return curves
+
+    def compute_tile(self, tile):
+        curves_0 = self.load_curves(tile[0])
+        curves_1 = curves_0 if tile[0] == tile[1] else self.load_curves(tile[1])
+
+        shape = (len(curves_0), len(curves_1), NR_CHANNELS)
+        tile_data = dict(mean = np.empty(shape, dtype = np.float32), max = np.empty(shape, dtype = np.float32))
+        if self.per_sample:
+            tile_data["per_sample"] = np.empty(shape + (self.nr_samples,), dtype = np.float32)
+        diff = np.empty_like(curves_1)
+        for i, curve in enumerate(curves_0):
+            # get_vc_diff with a single temporary
+            np.subtract(curves_1, curve, out = diff)
+            np.abs(diff, out = diff)
+            vc_diff = np.mean(diff, axis = -1)
+            tile_data["mean"][i] = np.mean(vc_diff, axis = -1)
+            tile_data["max"][i] = np.max(vc_diff, axis = -1)
+            if self.per_sample:
+                tile_data["per_sample"][i] = vc_diff
+        del diff
+
+        # np.savez appends .npz to names without it
+        tmp_path = f"{self.get_tile_path(tile)[:-4]}.tmp.npz"
+        np.savez(tmp_path, **tile_data)
+        os.replace(tmp_path, self.get_tile_path(tile))
+        return tile
+
+    def run(self, executor = "serial", nr_workers = None, verbose = True):
+        """
+        Computes the tiles that are not on disk yet, returns the number of tiles computed
+        executor : "serial", "thread" or "process", as in biasParser.set_executor
+        """
+        tiles = self.missing_tiles()
+
+        def report(done):
+            for i, tile in enumerate(done):
+                if verbose:
+                    print(f"tile {i + 1}/{len(tiles)}: {tile}")
+
+        if executor == "serial":
+            report(map(self.compute_tile, tiles))
+        else:
+            with EXECUTORS[executor](max_workers = nr_workers) as pool:
+                report(pool.map(self.compute_tile, tiles))
+        return len(tiles)
+
+    def assemble(self):
+        """
+        returns a dict with the "mean" and "max" matrices of shape [N, N, channels]
+        (and "per_sample", a memory map in out_dir of shape [N, N, channels, samples])
+        """
+        missing = self.missing_tiles()
+        if len(missing) > 0:
+            raise RuntimeError(f"{len(missing)} tiles are not computed yet, e.g. {missing[0]}")
+
+        nr_files = len(self.vc_files)
+        matrices = dict(mean = np.zeros((nr_files, nr_files, NR_CHANNELS), dtype = np.float32),
+                        max = np.zeros((nr_files, nr_files, NR_CHANNELS), dtype = np.float32))
+        if self.per_sample:
+            matrices["per_sample"] = np.lib.format.open_memmap(f"{self.out_dir}/per_sample.npy", mode = "w+",
+                                                               dtype = np.float32,
+                                                               shape = (nr_files, nr_files, NR_CHANNELS, self.nr_samples))
+        for tile in self.tiles:
+            block_0, block_1 = self.get_block(tile[0]), self.get_block(tile[1])
+            with np.load(self.get_tile_path(tile)) as tile_data:
+                for name, matrix in matrices.items():
+                    expected = matrix[block_0, block_1].shape
+                    if name not in tile_data or tile_data[name].shape != expected:
+                        raise ValueError(f"Tile {tile} does not match the configuration, "
+                                         f"{name} should have shape {expected}")
+                    matrix[block_0, block_1] = tile_data[name]
+                    matrix[block_1, block_0] = np.swapaxes(tile_data[name], 0, 1)
+        return matrices
@@ -0,0 +1,151 @@
+"""
+On-disk (SQLite) catalog of the bias scan runs and the files present in each run,
+so that scripts do not have to glob and probe files on /pnfs every time
+"""
+
+import os
+import re
+import glob
+import sqlite3
+
+
+FILE_KINDS = {
+    "bias_scan" : re.compile(r"^bias_scan\.root$"),
+    "pedestal" : re.compile(r"^pedestals?\.root$"),
+    "volCalConst" : re.compile(r"^volCalConst.*\.root$"),
+}
+
+
+def get_file_kind(filename):
+    for kind, pattern in FILE_KINDS.items():
+        if pattern.match(filename):
+            return kind
+    return "other"
+
+
+def get_number(name, prefix):
+    match = re.match(rf"{prefix}(\d+)", name)
+    return None if match is None else int(match.group(1))
+
+
+class RunCatalog():
+    """
+    Catalog of station{station}/run{run} directories below bias_dir and the files in them (with size and mtime).
+    refresh() only lists the runs whose directory changed since the last refresh
+    (files being added, removed or renamed change the modification time of the run directory)
+    or one of whose files changed size or modification time (files rewritten in place)
+    """
+    def __init__(self, db_path, bias_dir = None) -> None:
+        self.db_path = db_path
+        self.bias_dir = bias_dir
+        self.connection = sqlite3.connect(db_path)
+        with self.connection:
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS runs (
+                                         path TEXT PRIMARY KEY, station_dir TEXT, station INTEGER, run INTEGER, mtime REAL)""")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS files (
+                                         path TEXT PRIMARY KEY, run_path TEXT, kind TEXT, name TEXT, size INTEGER, mtime REAL)""")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS files_run ON files (run_path, kind)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS runs_station ON runs (station_dir, run)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def refresh(self, station_dirs = None, full = False, check_files = True):
+        """
+        Updates the catalog for the given station directories (all station* directories of bias_dir if None)
+        full : list every run again, also the ones that did not change
+        check_files : also stat the files of runs whose directory did not change, to catch files rewritten
+                      in place, which leave the directory untouched. Without it only the directories are checked
+        returns the number of runs that were (re)listed
+        """
+        if station_dirs is None:
+            station_dirs = glob.glob(f"{self.bias_dir}/station*")
+        nr_listed = 0
+        for station_dir in station_dirs:
+            station_dir = os.path.normpath(station_dir)
+            station = get_number(os.path.basename(station_dir), "station")
+            known = dict(self.connection.execute("SELECT path, mtime FROM runs WHERE station_dir = ?", (station_dir,)))
+
+            run_paths = [entry.path for entry in os.scandir(station_dir) if entry.is_dir() and entry.name.startswith("run")]
+            with self.connection:
+                for run_path in set(known) - set(run_paths):
+                    self._remove_run(run_path)
+                for run_path in run_paths:
+                    mtime = os.stat(run_path).st_mtime
+                    if not full and known.get(run_path) == mtime and not (check_files and self._files_changed(run_path)):
+                        continue
+                    self._list_run(run_path, station_dir, station, mtime)
+                    nr_listed += 1
+        return nr_listed
+
+    def _files_changed(self, run_path):
+        for path, size, mtime in self.connection.execute("SELECT path, size, mtime FROM files WHERE run_path = ?",
+                                                         (run_path,)):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return True
+            if stat.st_size != size or stat.st_mtime != mtime:
+                return True
+        return False
+
+    def _remove_run(self, run_path):
+        self.connection.execute("DELETE FROM runs WHERE path = ?", (run_path,))
+        self.connection.execute("DELETE FROM files WHERE run_path = ?", (run_path,))
+
+    def _list_run(self, run_path, station_dir, station, mtime):
+        self._remove_run(run_path)
+        self.connection.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?)",
+                                (run_path, station_dir, station, get_number(os.path.basename(run_path), "run"), mtime))
+        for entry in os.scandir(run_path):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            self.connection.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                                    (entry.path, run_path, get_file_kind(entry.name), entry.name, stat.st_size, stat.st_mtime))
+
+    def get_run_paths(self, station = None, station_dir = None, require = ()):
+        """
+        Run directories sorted on run number
+        station, station_dir : select on station number or on station directory
+        require : file kinds (see FILE_KINDS) a run must contain, e.g. ["bias_scan", "volCalConst"]
+        """
+        query = "SELECT path FROM runs WHERE 1"
+        parameters = []
+        if station is not None:
+            query += " AND station = ?"
+            parameters.append(int(station))
+        if station_dir is not None:
+            query += " AND station_dir = ?"
+            parameters.append(os.path.normpath(station_dir))
+        for kind in require:
+            query += " AND EXISTS (SELECT 1 FROM files WHERE files.run_path = runs.path AND files.kind = ?)"
+            parameters.append(kind)
+        query += " ORDER BY run"
+        return [row[0] for row in self.connection.execute(query, parameters)]
+
+    def get_files(self, run_path = None, kind = None, station = None):
+        """
+        returns a list of (path, size, mtime)
+        """
+        query = "SELECT files.path, files.size, files.mtime FROM files JOIN runs ON files.run_path = runs.path WHERE 1"
+        parameters = []
+        for column, value in [("files.run_path", run_path), ("files.kind", kind), ("runs.station", station)]:
+            if value is not None:
+                query += f" AND {column} = ?"
+                parameters.append(value)
+        query += " ORDER BY runs.run, files.name"
+        return list(self.connection.execute(query, parameters))
+
+    def get_file(self, run_path, kind):
+        """
+        Path of the (first) file of kind in run_path, None if the run does not contain one
+        """
+        files = self.get_files(run_path = os.path.normpath(run_path), kind = kind)
+        return None if len(files) == 0 else files[0][0]
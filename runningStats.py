@@ -0,0 +1,74 @@
+"""
+Streaming mean and variance (Welford / Chan et al.) that can be merged across files, processes and jobs.
+The state is (count, mean, M2) with M2 the sum of squared deviations from the mean, which does not suffer
+from the cancellation of E[x^2] - E[x]^2 at ADC scale.
+Floating point merging is not associative, so states are always merged in the order they are given:
+merging the same per-file states in the same order gives identical results however the files were distributed.
+"""
+
+import numpy as np
+
+
+class RunningStats():
+    """
+    Running mean and variance of arrays of a fixed shape
+    """
+    def __init__(self, shape = (), count = 0, mean = None, m2 = None) -> None:
+        self.count = count
+        self.mean = np.zeros(shape) if mean is None else np.array(mean, dtype = np.float64)
+        self.m2 = np.zeros(shape) if m2 is None else np.array(m2, dtype = np.float64)
+
+    @classmethod
+    def from_samples(cls, x, axis = 0):
+        """
+        State of a batch of samples along axis (two pass within the batch)
+        """
+        x = np.asarray(x, dtype = np.float64)
+        mean = np.mean(x, axis = axis)
+        m2 = np.sum((x - np.expand_dims(mean, axis))**2, axis = axis)
+        return cls(mean.shape, x.shape[axis], mean, m2)
+
+    def add(self, x, axis = 0):
+        self.merge(RunningStats.from_samples(x, axis))
+        return self
+
+    def merge(self, other):
+        """
+        Adds the state of other to this state (Chan et al. parallel update)
+        """
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean.copy(), other.m2.copy()
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * (other.count / count)
+        self.m2 = self.m2 + other.m2 + delta**2 * (self.count * other.count / count)
+        self.count = count
+        return self
+
+    def variance(self, ddof = 0):
+        return self.m2 / (self.count - ddof)
+
+    def std(self, ddof = 0):
+        return np.sqrt(self.variance(ddof))
+
+    def to_dict(self):
+        return dict(count = self.count, mean = self.mean, m2 = self.m2)
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(np.shape(state["mean"]), state["count"], state["mean"], state["m2"])
+
+
+def merge_states(states):
+    """
+    Merges a sequence of RunningStats (or their to_dict states) in the given order
+    """
+    total = None
+    for state in states:
+        state = state if isinstance(state, RunningStats) else RunningStats.from_dict(state)
+        total = RunningStats(state.mean.shape) if total is None else total
+        total.merge(state)
+    return total
@@ -0,0 +1,42 @@
+import argparse
+import os
+import glob
+
+from utility_functions import read_config
+from fitPool import FitPool, fit_task
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = '%(prog)s', description = "Refits bias scans with perform_fit in recycled worker processes")
+    parser.add_argument("--station", type = int, default = 13)
+    parser.add_argument("--config", default = "config.json")
+    parser.add_argument("--out_dir", default = None, help = "write to out_dir/run{nr} instead of the run directory")
+    parser.add_argument("--overwrite", action = "store_true", help = "also fit runs that have a VC file")
+    parser.add_argument("--ref", type = float, default = 1.5)
+    parser.add_argument("--workers", type = int, default = None)
+    parser.add_argument("--max_fits", type = int, default = 10, help = "fits per worker before it is replaced")
+    parser.add_argument("--max_memory", type = float, default = 4., help = "memory ceiling per worker in GB")
+    parser.add_argument("--timeout", type = float, default = 1800., help = "seconds per fit")
+    parser.add_argument("--retries", type = int, default = 1)
+    args = parser.parse_args()
+
+    config = read_config(args.config)
+
+    tasks = []
+    for run_path in sorted(glob.glob(f"{config['bias_dir']}/station{args.station}/run*")):
+        bias_path = f"{run_path}/bias_scan.root"
+        vc_dir = run_path if args.out_dir is None else f"{args.out_dir}/{os.path.basename(run_path)}"
+        if not os.path.exists(bias_path):
+            continue
+        if not args.overwrite and len(glob.glob(f"{vc_dir}/volCalConst*.root")) > 0:
+            continue
+        tasks.append((bias_path, vc_dir, args.ref))
+    print(f"Fitting {len(tasks)} bias scans")
+
+    pool = FitPool(fit_task, nr_workers = args.workers, max_tasks = args.max_fits,
+                   max_memory = int(args.max_memory * 1024**3), timeout = args.timeout, retries = args.retries)
+    results, failures = pool.run(tasks)
+
+    print(f"{len(results)} fits done, {len(failures)} failed")
+    for idx, error in failures.items():
+        print(f"{tasks[idx][0]}: {error}")
@@ -6,7 +6,10 @@ import numpy as np
 import matplotlib.pyplot as plt
 import uproot
 
-from utility_functions import save_to_pickle, unpack_vbias, unpack_adc, unpack_pedestal
+from utility_functions import save_to_pickle, unpack_pedestal
+from biasScan import BiasScan
+from biasScanCache import unpack_cached_vbias, unpack_cached_adc
+from linearity import align_to_pedestal, linearity_deviation
 
 
 
@@ -16,6 +19,9 @@ if __name__ == '__main__':
     parser.add_argument("--station", default = 13)
     parser.add_argument("--channel", default = [0], nargs="+")
     parser.add_argument("--config", default = "config.json")
+    parser.add_argument("--use_numba", action = "store_true")
+    parser.add_argument("--use_cache", action = "store_true",
+                        help = "read the bias scan from the memory mapped cache (see biasScanCache), converting it if needed")
     args = parser.parse_args()
 
     with open(args.config, "r") as config_json:
@@ -29,27 +35,25 @@ if __name__ == '__main__':
         args.channel = [int(ch) for ch in args.channel]
         ch_name = '_'.join(str(c) for c in args.channel)
     
-    # linear factors
-    adc_to_v = (2.5)/4095
-    v_to_adc = 4095/2.5
-
-    
     run_path = glob.glob(f"{config['bias_dir']}/station{args.station}/run{args.run}")[0]
     bias_path = f"{run_path}/bias_scan.root"
-    vbias = unpack_vbias(bias_path)
-    adc = unpack_adc(bias_path)
+    # only the requested channels and the first 2048 samples are read
+    if args.use_cache:
+        vbias = unpack_cached_vbias(bias_path)
+        adc = np.moveaxis(unpack_cached_adc(bias_path, channels = args.channel, samples = slice(0, 2048)), -1, 0)
+    else:
+        with BiasScan(bias_path) as bias_scan:
+            vbias = bias_scan.vbias
+            adc = bias_scan.get_adc(channels = args.channel, samples = slice(0, 2048))
 
     v_ped = unpack_pedestal(run_path)
-    v_ped_idx = [np.abs([vbias[:, DAC] - v_ped[DAC]]).argmin() for DAC in range(2)]
-    adc_ped = np.array([adc[v_ped_idx[int(ch > 11)], ch, :] for ch in range(24)])
-
-    vbias = vbias - v_ped
-    adc = adc - adc_ped
+    vbias, adc = align_to_pedestal(vbias, v_ped, adc, channels = args.channel)
 
-    adc_linear = vbias * v_to_adc
-    delta_adc = np.array([[adc[:, ch, s] - adc_linear[:, int(ch > 11)] for s in range(2048)] for ch in args.channel])
-    delta_adc_mean = np.mean(delta_adc, axis = 1)
-    delta_adc_std = np.std(delta_adc, axis = 1)
+    # shape (channels, samples, steps) as the calibration curves
+    adc = np.moveaxis(adc, 0, -1)
+    delta_adc = linearity_deviation(adc, vbias, args.channel, axis = "samples", use_numba = args.use_numba)
+    delta_adc_mean = delta_adc["mean"]
+    delta_adc_std = delta_adc["std"]
 
    
     pickle_name = f"{config['pickle_dir']}/delta_adc/delta_adc_run{args.run}_s{args.station}_ch{ch_name}"
@@ -0,0 +1,30 @@
+import argparse
+import os
+import glob
+
+from utility_functions import read_config
+from stationArchive import StationArchive
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = '%(prog)s')
+    parser.add_argument("-s", "--station", default = 13)
+    parser.add_argument("--dtype", default = "float32", choices = ["float32", "float64"])
+    parser.add_argument("--config", default = "config.json")
+    parser.add_argument("--exclude_2022", action = "store_true")
+    args = parser.parse_args()
+
+    config = read_config(args.config)
+
+    vc_files = glob.glob(f"{config['bias_dir']}/station{args.station}/run*/vol*")
+    if not args.exclude_2022:
+        vc_files += glob.glob(f"{config['bias_dir']}/season22_scan_testing/station{args.station}/vol*s{args.station}*")
+    vc_files = sorted(vc_files, key = lambda filename : filename.split("/")[-1])
+
+    # new scans are appended to an existing archive, the dtype is fixed when the archive is created
+    archive_dir = f"{config['archive_dir']}/station{args.station}"
+    if os.path.exists(f"{archive_dir}/meta.json"):
+        archive = StationArchive(archive_dir)
+    else:
+        archive = StationArchive.create(archive_dir, dtype = args.dtype)
+    nr_added = archive.append(vc_files)
+    print(f"Added {nr_added} scans, archive of station {args.station} contains {archive.nr_scans} scans")
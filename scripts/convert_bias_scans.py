@@ -0,0 +1,34 @@
+import argparse
+import os
+
+from utility_functions import read_config
+from biasParser import biasParser
+from biasScanCache import convert_bias_scan
+
+
+def convert_run(run_path, cache_dir = None, overwrite = False):
+    bias_path = f"{run_path}/bias_scan.root"
+    if not os.path.exists(bias_path):
+        return None
+    print(f"Converting {os.path.basename(run_path)}")
+    return convert_bias_scan(bias_path, cache_dir = cache_dir, overwrite = overwrite)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = '%(prog)s',
+                                     description = "Converts the bias scans of a station to the memory mapped cache of biasScanCache")
+    parser.add_argument("--station", type = int, default = 13)
+    parser.add_argument("--config", default = "config.json")
+    parser.add_argument("--cache_dir", default = None, help = "BIAS_CACHE_DIR or ~/.cache/bias_scans if not given")
+    parser.add_argument("--overwrite", action = "store_true", help = "also convert bias scans that are cached")
+    parser.add_argument("--executor", default = "serial", choices = ["serial", "thread", "process"])
+    parser.add_argument("--workers", type = int, default = None)
+    args = parser.parse_args()
+
+    config = read_config(args.config)
+
+    biasParser = biasParser(f"{config['bias_dir']}/station{args.station}")
+    biasParser.set_function(convert_run, dict(cache_dir = args.cache_dir, overwrite = args.overwrite))
+    biasParser.set_executor(args.executor, args.workers)
+    entries = biasParser.run()
+    print(f"Converted {len(entries)} bias scans")
@@ -0,0 +1,39 @@
+import argparse
+import os
+import glob
+
+from utility_functions import read_config
+from biasParser import biasParser
+from vcFit import fit_vc_file
+
+
+def fit_run(run_path, out_dir = None, station = None, overwrite = False):
+    bias_path = f"{run_path}/bias_scan.root"
+    if not os.path.exists(bias_path):
+        return None
+    # one directory per run in out_dir, as in the bias scan directory
+    vc_dir = run_path if out_dir is None else f"{out_dir}/{os.path.basename(run_path)}"
+    if not overwrite and len(glob.glob(f"{vc_dir}/volCalConst*.root")) > 0:
+        return None
+    print(f"Fitting {os.path.basename(run_path)}")
+    os.makedirs(vc_dir, exist_ok = True)
+    return fit_vc_file(bias_path, out_dir = vc_dir, station = station)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = '%(prog)s', description = "Fits the VC constants of bias scans without ROOT")
+    parser.add_argument("--station", type = int, default = 13)
+    parser.add_argument("--config", default = "config.json")
+    parser.add_argument("--out_dir", default = None, help = "write to out_dir/run{nr} instead of the run directory")
+    parser.add_argument("--overwrite", action = "store_true", help = "also fit runs that have a VC file")
+    parser.add_argument("--executor", default = "serial", choices = ["serial", "thread", "process"])
+    parser.add_argument("--workers", type = int, default = None)
+    args = parser.parse_args()
+
+    config = read_config(args.config)
+
+    biasParser = biasParser(f"{config['bias_dir']}/station{args.station}")
+    biasParser.set_function(fit_run, dict(out_dir = args.out_dir, station = args.station, overwrite = args.overwrite))
+    biasParser.set_executor(args.executor, args.workers)
+    vc_paths = biasParser.run()
+    print(f"Wrote {len(vc_paths)} VC files")
@@ -0,0 +1,56 @@
+import argparse
+import os
+import glob
+import numpy as np
+
+from utility_functions import read_config, stream_to_pickle
+from biasScan import BiasScan
+from biasScanCache import load_bias_scan
+from voltageCalibration import voltageCalibration
+from biasParser import biasParser
+from fitQuality import fit_quality, flag_samples
+
+
+def get_run_quality(run_path, max_chi2 = 5., max_residual = None, use_cache = False):
+    bias_path = f"{run_path}/bias_scan.root"
+    vc_paths = glob.glob(f"{run_path}/volCalConst*.root")
+    if not os.path.exists(bias_path) or len(vc_paths) == 0:
+        return None
+    print(f"Processing {os.path.basename(run_path)}")
+    if use_cache:
+        # the cache is channel major, fit_quality takes [steps, channels, samples]
+        cached = load_bias_scan(bias_path)
+        quality = fit_quality(cached["vbias"], np.moveaxis(cached["adc"], -1, 0), voltageCalibration(vc_paths[0]))
+    else:
+        with BiasScan(bias_path) as bias_scan:
+            quality = fit_quality(bias_scan.vbias, bias_scan.get_adc(), voltageCalibration(vc_paths[0]))
+    flagged = flag_samples(quality, max_chi2 = max_chi2, max_residual = max_residual)
+    maps = {name : quality[name].astype(np.float32) for name in ["chi2", "rms", "max_residual"]}
+    return dict(run = os.path.basename(run_path), vc_path = vc_paths[0], flagged = flagged,
+                nr_points = quality["nr_points"], **maps)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = '%(prog)s')
+    parser.add_argument("--station", default = 13)
+    parser.add_argument("--config", default = "config.json")
+    parser.add_argument("--max_chi2", type = float, default = 5.)
+    parser.add_argument("--max_residual", type = float, default = None, help = "in ADC counts")
+    parser.add_argument("--use_cache", action = "store_true",
+                        help = "read the bias scans from the memory mapped cache (see biasScanCache)")
+    parser.add_argument("--executor", default = "serial", choices = ["serial", "thread", "process"])
+    parser.add_argument("--workers", type = int, default = None)
+    args = parser.parse_args()
+
+    config = read_config(args.config)
+
+    biasParser = biasParser(f"{config['bias_dir']}/station{args.station}")
+    biasParser.set_function(get_run_quality, dict(max_chi2 = args.max_chi2, max_residual = args.max_residual,
+                                                     use_cache = args.use_cache))
+    biasParser.set_executor(args.executor, args.workers)
+
+    # one record (maps and flagged samples) per run, written as the runs come in
+    pickle_path = f"{config['pickle_dir']}/fit_quality/fit_quality_s{args.station}.pickle"
+    header = dict(station = args.station, max_chi2 = args.max_chi2, max_residual = args.max_residual)
+    nr_runs = stream_to_pickle(biasParser.iter_results(), pickle_path, header = header)
+    print(f"Wrote the fit quality of {nr_runs} runs to {pickle_path}")
@@ -7,8 +7,10 @@ import numpy as np
 import matplotlib.pyplot as plt
 import uproot
 
-from utility_functions import read_config, unpack_vbias, unpack_adc
+from utility_functions import read_config, unpack_vbias
+from linearity import V_REF, align_to_pedestal, select_window, linearity_deviation
 from voltageCalibration import voltageCalibration
+from runCatalog import RunCatalog
 
 
 def save_to_pickle(array, pickle_path):
@@ -23,7 +25,9 @@ if __name__ == '__main__':
     parser.add_argument("--station", default = 13)
     parser.add_argument("--channel", default = ["all"], nargs="+")
     parser.add_argument("--no_window", action = "store_true")
+    parser.add_argument("--use_catalog", action = "store_true")
     parser.add_argument("--config", default = "config.json")
+    parser.add_argument("--use_numba", action = "store_true")
     args = parser.parse_args()
 
     config = read_config(args.config)
@@ -33,11 +37,6 @@ if __name__ == '__main__':
     else:
         args.channel = [int(c) for c in args.channel]
     
-    # linear factors
-    vref = 1.5
-    adc_to_v = (2.5)/4095
-    v_to_adc = 4095/2.5
-
     if args.no_window:
         vmin = -1.3
         vmax = 0.7
@@ -45,8 +44,16 @@ if __name__ == '__main__':
         vmin = config['window'][0]
         vmax = config['window'][1]
     
-    run_paths = glob.glob(f"{config['bias_dir']}/station{args.station}/run*")
+    if args.use_catalog:
+        catalog = RunCatalog(config['run_catalog'], config['bias_dir'])
+        # only the runs that changed since the last refresh are listed again
+        catalog.refresh([f"{config['bias_dir']}/station{args.station}"])
+        run_paths = catalog.get_run_paths(station = args.station, require = ["bias_scan", "volCalConst"])
+    else:
+        run_paths = glob.glob(f"{config['bias_dir']}/station{args.station}/run*")
     run_paths = sorted(run_paths)
+    if len(run_paths) == 0:
+        raise RuntimeError(f"No runs of station {args.station} found in {config['bias_dir']}")
     vc_times = []
     delta_adc = []
     for run_path in run_paths:
@@ -54,29 +61,23 @@ if __name__ == '__main__':
         print(f'Processing {run_name}')
 
         bias_path = f"{run_path}/bias_scan.root"
-        vc_path = glob.glob(f"{run_path}/volCalConst*.root")[0]
+        if args.use_catalog:
+            vc_path = catalog.get_file(run_path, "volCalConst")
+        else:
+            vc_path = glob.glob(f"{run_path}/volCalConst*.root")[0]
         vc = voltageCalibration(vc_path)
         vc_time = vc.get_times()
         vc_times.append(vc_time)
         
         vbias = unpack_vbias(bias_path)
-        # rescale to pedestal
-        vbias = vbias - 1.5
-        # only keep values within boundaries
-        vbias = np.squeeze(
-            [vbias[(np.where((vmin < vbias[:, 0]) & (vbias[:, 0] < vmax))), 0],
-             vbias[(np.where((vmin < vbias[:, 1]) & (vbias[:, 1] < vmax))), 1]]).T
-        adc = unpack_adc(bias_path)
+        # rescale to pedestal, only keep values within boundaries
+        vbias = select_window(align_to_pedestal(vbias, V_REF), vmin, vmax)
 
         # adc in shape (channels, samples, ped)
-        adc_vc = np.array([
-                            [vc.get_fit_curve(vbias[:, int(ch > 11)], ch, s) for s in range(2048)]
-                            for ch in args.channel])
-        adc_linear = vbias * v_to_adc
-
-        delta_adc_run = np.array([[adc_vc[ch, s, :] - adc_linear[:, int(ch > 11)] for s in range(2048)] for ch in args.channel])
-        delta_adc_mean = np.mean(np.abs(delta_adc_run), axis = -1)
-        delta_adc_std = np.std(np.abs(delta_adc_run), axis = -1)
+        adc_vc = vc.get_fit_curves(vbias, channels = args.channel, samples = range(2048))
+        delta_adc_run = linearity_deviation(adc_vc, vbias, args.channel, axis = "steps", use_numba = args.use_numba)
+        delta_adc_mean = delta_adc_run["abs_mean"]
+        delta_adc_std = delta_adc_run["abs_std"]
         delta_adc.append([delta_adc_mean, delta_adc_std])
     delta_adc = np.array(delta_adc)
 
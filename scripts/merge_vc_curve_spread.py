@@ -0,0 +1,61 @@
+import argparse
+import os
+import glob
+import numpy as np
+
+from utility_functions import read_config, read_pickle, save_to_pickle
+from runningStats import merge_states
+
+
+def select_partials(partial_paths):
+    """
+    Partials of the same split (nr_jobs and file list) as the most recently written one,
+    partials of earlier runs with another split are skipped
+    raises ValueError if a job is missing or the partials do not cover the file list exactly once
+    """
+    partials = [(partial_path, read_pickle(partial_path)) for partial_path in sorted(partial_paths, key = os.path.getmtime)]
+    reference = partials[-1][1]
+    if "nr_jobs" not in reference:
+        raise ValueError(f"{partials[-1][0]} has no job split, rerun vc_curve_with_spread.py")
+    selected = {}
+    for partial_path, partial in partials:
+        if partial.get("nr_jobs") != reference["nr_jobs"] or partial.get("all_files") != reference["all_files"]:
+            print(f"Skipping {os.path.basename(partial_path)}, written by a run with another split or file list")
+            continue
+        selected[partial["job"]] = partial
+
+    missing = sorted(set(range(reference["nr_jobs"])) - set(selected))
+    if len(missing) > 0:
+        raise ValueError(f"Jobs {missing} of {reference['nr_jobs']} are missing")
+    vc_files = [vc_file for job in sorted(selected) for vc_file in selected[job]["vc_files"]]
+    if sorted(vc_files) != sorted(reference["all_files"]):
+        raise ValueError("The partials do not cover the files of the split exactly once")
+    return [selected[job] for job in sorted(selected)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = '%(prog)s',
+                                     description = "Merges the partial states of vc_curve_with_spread.py --nr_jobs > 1")
+    parser.add_argument("--station", default = 13)
+    parser.add_argument("--config", default = "config.json")
+    args = parser.parse_args()
+
+    config = read_config(args.config)
+
+    partial_paths = glob.glob(f"{config['pickle_dir']}/vc_curves/partial/vc_curv_spread_s{args.station}_job*")
+    partials = select_partials(partial_paths)
+    vc_files, file_states = [], []
+    for partial in partials:
+        v_points = partial["v"]
+        vc_files += partial["vc_files"]
+        file_states += partial["states"]
+    print(f"Merging {len(vc_files)} files from {len(partials)} jobs")
+
+    # merged in file order, as a single job would
+    order = np.argsort(vc_files, kind = "stable")
+    stats = merge_states([file_states[i] for i in order])
+
+    pickle_dict = dict(station = args.station, v = v_points, mean = stats.mean, std = stats.std(),
+                       nr_files = len(vc_files))
+    pickle_name = f"{config['pickle_dir']}/vc_curves/vc_curv_spread_s{args.station}"
+    save_to_pickle(pickle_dict, pickle_name)
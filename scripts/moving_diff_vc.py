@@ -4,29 +4,26 @@ import glob
 import numpy as np
 import matplotlib.pyplot as plt
 
-from utility_functions import read_config, save_to_pickle, unpack_fit_times, unpack_fit_coeff, unpack_fit_residuals, fitted_adc_with_res
+from utility_functions import read_config, save_to_pickle
+from voltageCalibration import voltageCalibration
 from biasParser import biasParser
 
 
 
-def calculate_difference_runs(run_path_0, run_path_1, channel = 0, fit_min = -1.29, fit_max = 0.69, v_step = 0.1, DAC = 0):
-    print(f"Processing run {os.path.basename(run_path_1)}")
-    vc_path_0 = glob.glob(f"{run_path_0}/volCal*")[0]
-    vc_path_1 = glob.glob(f"{run_path_1}/volCal*")[0]
+def load_run(run_path, channel = 0, fit_min = -1.29, fit_max = 0.69, v_step = 0.1):
+    print(f"Processing run {os.path.basename(run_path)}")
+    vc_path = glob.glob(f"{run_path}/volCal*")[0]
+    # lazy loading only reads the coefficients of the requested channel
+    vc = voltageCalibration(vc_path, lazy = True)
+    v = np.arange(fit_min, fit_max, v_step)
+    adc = vc.get_fit_curves(v, channels = channel, dtype = np.float64)[0]
     # select start time
-    time = unpack_fit_times(vc_path_0)[0]
-
-    vc_0 = unpack_fit_coeff(vc_path_0)
-    resv_0, res_0 = unpack_fit_residuals(vc_path_0)
-    vc_1 = unpack_fit_coeff(vc_path_1)
-    resv_1, res_1 = unpack_fit_residuals(vc_path_1)
+    return vc.get_times()[0], adc
 
-    v = np.arange(fit_min, fit_max, v_step)
-    adc_0 = np.array([fitted_adc_with_res(v, vc, resv_0[:, DAC], res_0[:, DAC])
-             for vc in vc_0[channel, :]])
-    adc_1 = np.array([fitted_adc_with_res(v, vc, resv_1[:, DAC], res_1[:, DAC])
-             for vc in vc_1[channel, :]])
 
+def calculate_difference_runs(run_0, run_1):
+    time, adc_0 = run_0
+    _, adc_1 = run_1
     vc_diff = np.abs(adc_1 - adc_0)
     vc_diff_mean = np.mean(vc_diff)
     vc_diff_std = np.std(vc_diff)
@@ -37,18 +34,25 @@ def calculate_difference_runs(run_path_0, run_path_1, channel = 0, fit_min = -1.
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(prog = '%(prog)s')
     parser.add_argument("--station", default = 13)
-    parser.add_argument("--channel", default = 0)
+    parser.add_argument("--channel", type = int, default = 0)
+    parser.add_argument("--lag", type = int, default = 1)
     parser.add_argument("--config", default = "config.json")
+    parser.add_argument("--executor", default = "serial", choices = ["serial", "thread", "process"])
+    parser.add_argument("--workers", type = int, default = None)
     args = parser.parse_args()
 
     config = read_config(args.config)   
 
     run_dir = f"{config['bias_dir']}/station{args.station}"
     biasParser = biasParser(run_dir)
-    kwargs = dict(channel = args.channel)
-    biasParser.set_function(calculate_difference_runs, kwargs)
-    results = np.array(biasParser.double_run())
+    # every run is loaded once, the comparison gets the already evaluated curves
+    biasParser.set_loader(load_run, dict(channel = args.channel))
+    biasParser.set_function(calculate_difference_runs)
+    biasParser.set_executor(args.executor, args.workers)
+    results = np.array(biasParser.window_run(lag = args.lag))
     
-    pickle_dict = dict(time = results[:, 0], vc_diff = results[:, 1], vc_diff_std = results[:, 2], station = args.station, channel = args.channel)
-    pickle_path = f"{config['pickle_dir']}/vc_diff/vc_diff_s{args.station}.pickle"
+    pickle_dict = dict(time = results[:, 0], vc_diff = results[:, 1], vc_diff_std = results[:, 2], station = args.station, channel = args.channel, lag = args.lag)
+    # lag 1 keeps the original name, other lags get their own file
+    pickle_path = f"{config['pickle_dir']}/vc_diff/vc_diff_s{args.station}"
+    pickle_path += ".pickle" if args.lag == 1 else f"_lag{args.lag}.pickle"
     save_to_pickle(pickle_dict, pickle_path)
\ No newline at end of file
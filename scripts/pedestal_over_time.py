@@ -5,7 +5,7 @@ import uproot
 import numpy as np
 import matplotlib.pyplot as plt
 
-from utility_functions import save_to_pickle
+from utility_functions import stream_to_pickle
 from biasParser import biasParser
         
 
@@ -29,6 +29,8 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(prog = '%(prog)s')
     parser.add_argument("--station", default=13)
     parser.add_argument("--config", default="config.json")
+    parser.add_argument("--executor", default="serial", choices=["serial", "thread", "process"])
+    parser.add_argument("--workers", type=int, default=None)
     args = parser.parse_args()
 
 
@@ -37,10 +39,8 @@ if __name__ == '__main__':
 
     biasParser = biasParser(f"{config['bias_dir']}/station{args.station}")
     biasParser.set_function(read_time_and_pedestal)
-    pedestals = biasParser.run()
-    pedestal_times = [ped[0] for ped in pedestals]
-    pedestals = [ped[1] for ped in pedestals]
+    biasParser.set_executor(args.executor, args.workers)
 
-    ped_dict = dict(pedestal_times = pedestal_times, pedestals = pedestals, station = args.station)
+    # every run is written to the pickle as it is read, one record of (time, vbias) per run
     pickle_path = f"{config['pickle_dir']}/pedestals/ped_over_time_s{args.station}.pickle"
-    save_to_pickle(ped_dict, pickle_path)
\ No newline at end of file
+    stream_to_pickle(biasParser.iter_results(), pickle_path, header = dict(station = args.station))
\ No newline at end of file
@@ -3,7 +3,7 @@ import json
 import numpy as np
 import matplotlib.pyplot as plt
 
-from utility_functions import read_pickle
+from utility_functions import iter_pickle_stream
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(prog = '%(prog)s')
@@ -16,10 +16,13 @@ if __name__ == '__main__':
 
     DAC = 0
 
-    ped_dict = read_pickle(args.pickle)
-    station = ped_dict["station"]
-    times = ped_dict["pedestal_times"]
-    pedestals = np.squeeze(ped_dict["pedestals"])
+    header, records = iter_pickle_stream(args.pickle)
+    station = header["station"]
+    times, pedestals = [], []
+    for pedestal_time, pedestal in records:
+        times.append(pedestal_time)
+        pedestals.append(pedestal)
+    pedestals = np.squeeze(pedestals)
 
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize = (12, 8))
     ax1.plot(times, pedestals)
@@ -0,0 +1,21 @@
+import argparse
+
+from utility_functions import read_config
+from runCatalog import RunCatalog
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = '%(prog)s')
+    parser.add_argument("--station", default = None, nargs = "+")
+    parser.add_argument("--full", action = "store_true")
+    parser.add_argument("--config", default = "config.json")
+    args = parser.parse_args()
+
+    config = read_config(args.config)
+
+    station_dirs = None
+    if args.station is not None:
+        station_dirs = [f"{config['bias_dir']}/station{station}" for station in args.station]
+
+    with RunCatalog(config['run_catalog'], config['bias_dir']) as catalog:
+        nr_listed = catalog.refresh(station_dirs, full = args.full)
+        print(f"Listed {nr_listed} new or changed runs")
@@ -1,18 +1,10 @@
 import argparse
-import glob
 import datetime
 import numpy as np
 import matplotlib.pyplot as plt
 
 from utility_functions import read_config
-
-def get_time_from_filename(filename):
-    """
-    assumes filename to be of the form volCalConsts_pol9_s{station}_{start_time}-{end_time}.root
-    """
-    time = filename.split("_")[-1]
-    time = time.split("-")[0]
-    return int(time)
+from calibrationCatalog import CalibrationCatalog
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(prog = '%(prog)s')
@@ -23,13 +15,8 @@ if __name__ == '__main__':
     stations = [11, 12, 13, 21, 22, 23, 24]
 
     
-    times = []
-    for station in stations:
-        vc_files = glob.glob(f"{config['bias_dir']}/station{station}/run*/vol*")
-        vc_files += glob.glob(f"{config['bias_dir']}/season22_scan_testing/station{station}/vol*s{station}*")
-        vc_files = sorted(vc_files, key = lambda filename : filename.split("/")[-1])
-        times_station = [get_time_from_filename(vc_file) for vc_file in vc_files]
-        times.append(times_station)
+    catalog = CalibrationCatalog.from_directory(config['bias_dir'], stations)
+    times = [catalog.get_times(station)[:, 0].tolist() for station in stations]
 
     times_utc = [[datetime.datetime.fromtimestamp(time) for time in times_station] for times_station in times]
     times_utc = [[time.strftime("%d-%b-%Y") for time in times_station] for times_station in times_utc]
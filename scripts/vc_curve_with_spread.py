@@ -1,43 +1,65 @@
 import argparse
+import os
 import glob
 import numpy as np
-import matplotlib.pyplot as plt
 
-from utility_functions import read_config, save_to_pickle, unpack_fit_coeff, unpack_fit_residuals, fitted_adc_with_res
+from utility_functions import read_config, save_to_pickle
+from voltageCalibration import voltageCalibration
+from runningStats import RunningStats, merge_states
+from biasParser import EXECUTORS
+
+
+def get_file_state(vc_file, v_points):
+    """
+    mean and M2 over the samples of one calibration, per channel and voltage
+    """
+    adc_vc = voltageCalibration(vc_file).get_fit_curves(v_points, dtype = np.float64)
+    return RunningStats.from_samples(adc_vc, axis = 1).to_dict()
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(prog = '%(prog)s')
     parser.add_argument("--station", default = 13)
     parser.add_argument("--config", default = "config.json")
+    parser.add_argument("--job", type = int, default = 0)
+    parser.add_argument("--nr_jobs", type = int, default = 1,
+                        help = "split the files over jobs, merge the partial states with merge_vc_curve_spread.py")
+    parser.add_argument("--executor", default = "serial", choices = ["serial", "thread", "process"])
+    parser.add_argument("--workers", type = int, default = None)
     args = parser.parse_args()
 
     config = read_config(args.config)
 
-    vc_files = glob.glob(f"{config['bias_dir']}/station{args.station}/run*/vol*")[:50]
+    # the file order is the merge order, sorting makes the result independent of the job splitting
+    all_files = sorted(glob.glob(f"{config['bias_dir']}/station{args.station}/run*/vol*"))
+    vc_files = all_files[args.job :: args.nr_jobs]
 
     window = config["window"]
-    channels = list(range(24))
-
     v_points = np.arange(window[0], window[1], 0.01)
-    adc_mean = np.zeros((24, len(v_points)))
-    adc_squares = np.zeros((24, len(v_points)))
-
-    for i, vc_file in enumerate(vc_files):
-        print(f"Processing file {i + 1}/{len(vc_files)}")
-        vc_coeff = unpack_fit_coeff(vc_file)
-        vc_vres, vc_res = unpack_fit_residuals(vc_file)
-
-        adc_vc = np.array([
-                        [fitted_adc_with_res(v_points, vc_coeff[ch, s], vc_vres[:,int(ch > 11)], vc_res[:,int(ch > 11)]) for s in range(4096)]
-                        for ch in channels])
-        adc_mean += np.sum(adc_vc, axis = 1)
-        adc_squares += np.sum(adc_vc**2, axis = 1)
-    
-    adc_mean /= (4096*len(vc_files))
-    adc_squares /= (4096*len(vc_files))
-    adc_var = adc_squares - adc_mean**2
-    adc_std = np.sqrt(adc_var)
-
-    pickle_dict = dict(station = args.station, v = v_points, mean = adc_mean, std = adc_std)
+
+    def collect(states):
+        file_states = []
+        for i, state in enumerate(states):
+            print(f"Processing file {i + 1}/{len(vc_files)}")
+            file_states.append(state)
+        return file_states
+
+    if args.executor == "serial":
+        file_states = collect(map(get_file_state, vc_files, [v_points] * len(vc_files)))
+    else:
+        with EXECUTORS[args.executor](max_workers = args.workers) as pool:
+            file_states = collect(pool.map(get_file_state, vc_files, [v_points] * len(vc_files)))
+
     pickle_name = f"{config['pickle_dir']}/vc_curves/vc_curv_spread_s{args.station}"
-    save_to_pickle(pickle_dict, pickle_name)
\ No newline at end of file
+    if args.nr_jobs > 1:
+        # the job split is stored so the merge can reject partials of another split or file list
+        pickle_dict = dict(station = args.station, v = v_points, vc_files = vc_files, states = file_states,
+                           job = args.job, nr_jobs = args.nr_jobs, all_files = all_files)
+        os.makedirs(f"{config['pickle_dir']}/vc_curves/partial", exist_ok = True)
+        pickle_name = f"{config['pickle_dir']}/vc_curves/partial/vc_curv_spread_s{args.station}_job{args.job}"
+        save_to_pickle(pickle_dict, pickle_name)
+    else:
+        stats = merge_states(file_states)
+        pickle_dict = dict(station = args.station, v = v_points, mean = stats.mean, std = stats.std(),
+                           nr_files = len(vc_files))
+        save_to_pickle(pickle_dict, pickle_name)
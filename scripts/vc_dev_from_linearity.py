@@ -6,7 +6,9 @@ import numpy as np
 import matplotlib.pyplot as plt
 import uproot
 
-from utility_functions import read_config, unpack_vbias, unpack_adc, unpack_fit_coeff, unpack_fit_residuals, fitted_adc_with_res, unpack_pedestal
+from utility_functions import read_config, unpack_vbias, unpack_pedestal
+from voltageCalibration import voltageCalibration
+from linearity import align_to_pedestal, select_window, linearity_deviation
 
 
 
@@ -23,6 +25,7 @@ if __name__ == '__main__':
     parser.add_argument("--station", default = 13)
     parser.add_argument("--channel", default = [0], nargs="+")
     parser.add_argument("--config", default = "config.json")
+    parser.add_argument("--use_numba", action = "store_true")
     args = parser.parse_args()
 
     config = read_config(args.config)
@@ -34,42 +37,23 @@ if __name__ == '__main__':
         args.channel = [int(ch) for ch in args.channel]
         ch_name = '_'.join(str(c) for c in args.channel)
     
-    # linear factor
-    v_to_adc = 4095/2.5
-
-    # limits used in VC parameter fit
-    v_min = 0.2
-    v_max = 2.2
-
-
-
-    
     run_path = glob.glob(f"{config['bias_dir']}/station{args.station}/run{args.run}")[0]
     bias_path = f"{run_path}/bias_scan.root"
     vc_path = glob.glob(f"{run_path}/volCalConst*.root")[0]
 
     vbias = unpack_vbias(bias_path)
-    adc = unpack_adc(bias_path)
-    vc_coeff = unpack_fit_coeff(vc_path)
-    vc_vres, vc_res = unpack_fit_residuals(vc_path)
     ped = unpack_pedestal(run_path)
+    vc = voltageCalibration(vc_path, lazy = True)
 
-    # per DAC
-    vbias[:, 0] = vbias[:, 0] - ped[0]
-    vbias[:, 1] = vbias[:, 1] - ped[1]
-    # only look within fit boundaries
-    vbias = np.squeeze(
-            [vbias[(np.where((-1.3 < vbias[:, 0]) & (vbias[:, 0] < 0.7))), 0],
-             vbias[(np.where((-1.3 < vbias[:, 1]) & (vbias[:, 1] < 0.7))), 1]])
-
-    adc_vc = np.array([
-                       [fitted_adc_with_res(vbias[int(ch > 11)], vc_coeff[ch, s], vc_vres[:,int(ch > 11)], vc_res[:,int(ch > 11)]) for s in range(4096)]
-                       for ch in args.channel])
+    # per DAC, only look within fit boundaries
+    vbias = select_window(align_to_pedestal(vbias, ped), -1.3, 0.7)
 
-    adc_linear = vbias * v_to_adc
-    delta_adc = np.array([[adc_vc[ch, s, :] - adc_linear[int(ch > 11)] for s in range(2048)] for ch in args.channel])
-    delta_adc_mean = np.mean(delta_adc, axis = (1))
-    delta_adc_std = np.std(delta_adc, axis = (1))
+    adc_vc = vc.get_fit_curves(vbias, channels = args.channel, samples = range(2048), dtype = np.float64)
+    delta_adc = linearity_deviation(adc_vc, vbias, args.channel, axis = "samples", use_numba = args.use_numba)
+    delta_adc_mean = delta_adc["mean"]
+    delta_adc_std = delta_adc["std"]
+    # stored as (DAC, points) as before
+    vbias = vbias.T
 
     pickle_name = f"{config['pickle_dir']}/delta_adc/delta_adc_vc_run{args.run}_s{args.station}_ch{ch_name}"
     pickle_dict = dict(run = args.run, station = args.station, channel = args.channel,
@@ -0,0 +1,66 @@
+import argparse
+import glob
+import numpy as np
+
+from driftEngine import DriftEngine
+from utility_functions import read_config, save_to_pickle
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = '%(prog)s',
+                                     description = "vc_drift_with_ref.py, vc_drift_no_ref.py and the moving difference of "
+                                                   "moving_diff_vc.py (on the same VC files) in one pass")
+    parser.add_argument("-s", "--station", default=13)
+    parser.add_argument("--vc_ref_file", default = None)
+    parser.add_argument("--config", default = "config.json")
+    parser.add_argument("--exclude_2022", action = "store_true")
+    parser.add_argument("--no_window", action="store_true")
+    parser.add_argument("--channel", type = int, default = 0, help = "channel of the moving difference")
+    parser.add_argument("--lags", type = int, nargs = "+", default = [1])
+    args = parser.parse_args()
+
+    config = read_config(args.config)
+
+    vc_files = glob.glob(f"{config['bias_dir']}/station{args.station}/run*/vol*")
+    if not args.exclude_2022:
+        vc_files += glob.glob(f"{config['bias_dir']}/season22_scan_testing/station{args.station}/vol*s{args.station}*")
+    vc_files = sorted(vc_files, key = lambda filename : filename.split("/")[-1])
+
+    if args.no_window:
+        v_range = np.arange(-1.2, 0.7, 0.1)
+    else:
+        step = 0.02
+        v_range = np.arange(config['window'][0], config['window'][1] + step, step)
+
+    vc_ref_file = vc_files[0] if args.vc_ref_file is None else args.vc_ref_file
+    drift = DriftEngine(v_range, vc_ref_file, lags = args.lags, lag_channel = args.channel).run(vc_files)
+
+    pickle_dict = dict(times = drift.times, adc_diffs = drift.ref_diffs, station = args.station, v = v_range,
+                       vc_ref_file = vc_ref_file, window = config['window'])
+    pickle_name = f"{config['pickle_dir']}/vc_drift_ref/vc_drift_ref_s{args.station}"
+    if not args.no_window:
+        pickle_name += f"_w{config['window'][0]:.1f}_{config['window'][1]:.1f}"
+    else:
+        pickle_name += "_no_window"
+    save_to_pickle(pickle_dict, pickle_name)
+
+    pickle_dict = dict(times = drift.prev_times, adc_diffs = drift.prev_diffs, station = args.station, v = v_range,
+                       vc_ref_file = args.vc_ref_file, window = config['window'])
+    pickle_name = f"{config['pickle_dir']}/vc_drift_no_ref/vc_drift_no_ref_s{args.station}"
+    if not args.no_window:
+        pickle_name += f"_w{config['window'][0]}_{config['window'][1]}"
+    else:
+        pickle_name += "_no_window"
+    save_to_pickle(pickle_dict, pickle_name)
+
+    # the moving difference runs over the VC files above, not over the one file per run of moving_diff_vc.py,
+    # so it gets its own name instead of overwriting vc_diff_s{station}.pickle
+    for lag, lag_results in drift.lag_results.items():
+        if len(lag_results) == 0:
+            print(f"Skipping lag {lag}, only {len(vc_files)} scans")
+            continue
+        results = np.array(lag_results)
+        pickle_dict = dict(time = results[:, 0], vc_diff = results[:, 1], vc_diff_std = results[:, 2],
+                           station = args.station, channel = args.channel, lag = lag, vc_files = vc_files)
+        pickle_path = f"{config['pickle_dir']}/vc_diff/vc_drift_diff_s{args.station}_lag{lag}.pickle"
+        save_to_pickle(pickle_dict, pickle_path)
@@ -0,0 +1,55 @@
+import argparse
+import glob
+
+from voltageCalibration import voltageCalibration
+from analyticMetrics import WindowMetrics
+from utility_functions import read_config, save_to_pickle
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = '%(prog)s',
+                                     description = "Exact RMS and mean drift over the window, to the reference and to the previous scan")
+    parser.add_argument("-s", "--station", default=13)
+    parser.add_argument("--vc_ref_file", default = None)
+    parser.add_argument("--config", default = "config.json")
+    parser.add_argument("--exclude_2022", action = "store_true")
+    parser.add_argument("--no_window", action="store_true")
+    args = parser.parse_args()
+
+    config = read_config(args.config)
+
+    vc_files = glob.glob(f"{config['bias_dir']}/station{args.station}/run*/vol*")
+    if not args.exclude_2022:
+        vc_files += glob.glob(f"{config['bias_dir']}/season22_scan_testing/station{args.station}/vol*s{args.station}*")
+    vc_files = sorted(vc_files, key = lambda filename : filename.split("/")[-1])
+    if args.vc_ref_file is None:
+        args.vc_ref_file = vc_files[0]
+
+    # same limits as the sampled grids of the drift scripts
+    window = [-1.2, 0.6] if args.no_window else config['window']
+    metrics = WindowMetrics(*window)
+
+    vcRef = voltageCalibration(args.vc_ref_file)
+    vc_prev = None
+    t, rms_ref, mean_ref, rms_prev, mean_prev = [], [], [], [], []
+    for i, vc_file in enumerate(vc_files):
+        print(f"vc {i}/{len(vc_files) - 1}")
+        vc = voltageCalibration(vc_file)
+        t.append(vc.get_times()[0])
+        rms, mean = metrics.drift(vcRef, vc)
+        rms_ref.append(rms)
+        mean_ref.append(mean)
+        if vc_prev is not None:
+            rms, mean = metrics.drift(vc_prev, vc)
+            rms_prev.append(rms)
+            mean_prev.append(mean)
+        vc_prev = vc
+
+    pickle_dict = dict(times = t, rms_ref = rms_ref, mean_ref = mean_ref, rms_prev = rms_prev, mean_prev = mean_prev,
+                       station = args.station, vc_ref_file = args.vc_ref_file, window = window)
+    pickle_name = f"{config['pickle_dir']}/vc_drift_analytic/vc_drift_analytic_s{args.station}"
+    if not args.no_window:
+        pickle_name += f"_w{config['window'][0]:.1f}_{config['window'][1]:.1f}"
+    else:
+        pickle_name += "_no_window"
+    save_to_pickle(pickle_dict, pickle_name)
@@ -0,0 +1,51 @@
+import argparse
+import glob
+import numpy as np
+
+from voltageCalibration import voltageCalibration
+from pairwiseDrift import PairwiseDrift
+from utility_functions import read_config, save_to_pickle
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = '%(prog)s')
+    parser.add_argument("-s", "--station", default=13)
+    parser.add_argument("--config", default = "config.json")
+    parser.add_argument("--exclude_2022", action = "store_true")
+    parser.add_argument("--no_window", action="store_true")
+    parser.add_argument("--memory", type = float, default = 2., help = "memory budget per worker in GB")
+    parser.add_argument("--per_sample", action = "store_true")
+    parser.add_argument("--executor", default = "serial", choices = ["serial", "thread", "process"])
+    parser.add_argument("--workers", type = int, default = None)
+    args = parser.parse_args()
+
+    config = read_config(args.config)
+
+    vc_files = glob.glob(f"{config['bias_dir']}/station{args.station}/run*/vol*")
+    if not args.exclude_2022:
+        vc_files += glob.glob(f"{config['bias_dir']}/season22_scan_testing/station{args.station}/vol*s{args.station}*")
+    vc_files = sorted(vc_files, key = lambda filename : filename.split("/")[-1])
+
+    if args.no_window:
+        v_range = np.arange(-1.2, 0.7, 0.1)
+    else:
+        step = 0.02
+        v_range = np.arange(config['window'][0], config['window'][1] + step, step)
+
+    # tiles already on disk from an interrupted run are not computed again
+    out_dir = f"{config['pickle_dir']}/vc_drift_matrix/s{args.station}"
+    pairwise_drift = PairwiseDrift(vc_files, v_range, out_dir, memory_budget = int(args.memory * 1024**3),
+                                   per_sample = args.per_sample)
+    print(f"{len(vc_files)} calibrations, blocks of {pairwise_drift.block_size}, {len(pairwise_drift.tiles)} tiles")
+    pairwise_drift.run(args.executor, args.workers)
+    matrices = pairwise_drift.assemble()
+
+    times = [voltageCalibration(vc_file, lazy = True).get_times()[0] for vc_file in vc_files]
+    pickle_dict = dict(times = times, vc_files = vc_files, drift_mean = matrices["mean"], drift_max = matrices["max"],
+                       station = args.station, v = v_range, window = config['window'])
+    pickle_name = f"{config['pickle_dir']}/vc_drift_matrix/vc_drift_matrix_s{args.station}"
+    if not args.no_window:
+        pickle_name += f"_w{config['window'][0]:.1f}_{config['window'][1]:.1f}"
+    else:
+        pickle_name += "_no_window"
+    save_to_pickle(pickle_dict, pickle_name)
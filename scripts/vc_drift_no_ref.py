@@ -21,9 +21,6 @@ if __name__ == '__main__':
 
     config = read_config(args.config)
 
-    samples = list(range(4096))
-    channels = list(range(24))
-
     vc_files = glob.glob(f"{config['bias_dir']}/station{args.station}/run*/vol*")
     if not args.exclude_2022:
         vc_files += glob.glob(f"{config['bias_dir']}/season22_scan_testing/station{args.station}/vol*s{args.station}*")
@@ -37,6 +34,8 @@ if __name__ == '__main__':
         print(v_range)
     
     vc_prev = voltageCalibration(vc_files[0])
+    # the curves of the previous scan are kept from the previous iteration
+    adc_prev = vc_prev.get_fit_curves(v_range)
 
     t = []
     adc_diffs = []
@@ -45,13 +44,10 @@ if __name__ == '__main__':
         vc = voltageCalibration(vc_file)
         t.append(vc.get_times()[0])
     
-        adc_prev = np.array(
-                    [[vc_prev.get_fit_curve(v_range, ch, s) for s in samples] for ch in channels])
-        adc = np.array(
-                [[vc.get_fit_curve(v_range, ch, s) for s in samples] for ch in channels])
+        adc = vc.get_fit_curves(v_range)
         adc_diff = get_vc_diff(adc_prev, adc)
         adc_diffs.append(adc_diff)
-        vc_prev = vc
+        adc_prev = adc
     
     pickle_dict = dict(times = t, adc_diffs = adc_diffs, station = args.station, v = v_range,
                        vc_ref_file = args.vc_ref_file, window = config['window'])
@@ -21,9 +21,6 @@ if __name__ == '__main__':
 
     config = read_config(args.config)
 
-    samples = list(range(4096))
-    channels = list(range(24))
-
     vc_files = glob.glob(f"{config['bias_dir']}/station{args.station}/run*/vol*")
     if not args.exclude_2022:
         vc_files += glob.glob(f"{config['bias_dir']}/season22_scan_testing/station{args.station}/vol*s{args.station}*")
@@ -40,8 +37,7 @@ if __name__ == '__main__':
         v_range = np.arange(config['window'][0], config['window'][1] + step, step)
     
     t_ref = vcRef.get_times()[0]
-    adc_ref = np.array(
-                [[vcRef.get_fit_curve(v_range, ch, s) for s in samples] for ch in channels])
+    adc_ref = vcRef.get_fit_curves(v_range)
 
     t = []
     adc_diffs = []
@@ -49,8 +45,7 @@ if __name__ == '__main__':
         print(f"vc {i}/{len(vc_files) - 1}")
         vc = voltageCalibration(vc_file)
         t.append(vc.get_times()[0])
-        adc = np.array(
-                [[vc.get_fit_curve(v_range, ch, s) for s in samples] for ch in channels])
+        adc = vc.get_fit_curves(v_range)
         adc_diff = get_vc_diff(adc_ref, adc)
         adc_diffs.append(adc_diff)
     
@@ -0,0 +1,159 @@
+"""
+Archive of all voltage calibrations of a station in one memory mapped array,
+so station wide analyses read one file sequentially instead of opening every VC file.
+
+An archive is a directory containing
+    coeffs.bin : raw array of shape [scans, channel, sample, order] in the chosen dtype, appended per scan
+    times.npy : start and end time per scan, shape [scans, 2]
+    vres.npy, res.npy : residual tables per scan and DAC, shape [scans, points, DAC] (NaN padded)
+    nr_res.npy : number of residual points per scan
+    meta.json : shapes, dtype and the source file of every scan, written last so a crash during an append
+                leaves the archive at its previous state
+"""
+
+import os
+import json
+
+import numpy as np
+
+from voltageCalibration import voltageCalibration
+
+
+class StationArchive():
+    """
+    Read and append access to a station archive, scans are stored in the order they are appended
+    and a time index (sorted on start time) is kept for time range queries
+    """
+    def __init__(self, archive_dir) -> None:
+        self.archive_dir = archive_dir
+        with open(f"{archive_dir}/meta.json", "r") as meta_file:
+            self.meta = json.load(meta_file)
+        self._load_sidecars()
+
+    @classmethod
+    def create(cls, archive_dir, dtype = "float32", nr_channels = 24, nr_samples = 4096, order = 10):
+        os.makedirs(archive_dir, exist_ok = True)
+        if os.path.exists(f"{archive_dir}/meta.json"):
+            raise FileExistsError(f"{archive_dir} already contains an archive")
+        meta = dict(dtype = np.dtype(dtype).name, nr_channels = nr_channels, nr_samples = nr_samples,
+                    order = order, paths = [])
+        open(f"{archive_dir}/coeffs.bin", "wb").close()
+        cls._write_sidecars(archive_dir, np.empty((0, 2), dtype = np.int64),
+                            np.empty((0, 0, 2)), np.empty((0, 0, 2)), np.empty(0, dtype = np.int64))
+        cls._write_meta(archive_dir, meta)
+        return cls(archive_dir)
+
+    @staticmethod
+    def _write_meta(archive_dir, meta):
+        tmp_path = f"{archive_dir}/meta.json.tmp"
+        with open(tmp_path, "w") as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(tmp_path, f"{archive_dir}/meta.json")
+
+    @staticmethod
+    def _write_sidecars(archive_dir, times, vres, res, nr_res):
+        # every sidecar is replaced as a whole, a crash leaves each of them either old or new
+        for name, array in [("times", times), ("vres", vres), ("res", res), ("nr_res", nr_res)]:
+            np.save(f"{archive_dir}/{name}.tmp.npy", array)
+            os.replace(f"{archive_dir}/{name}.tmp.npy", f"{archive_dir}/{name}.npy")
+
+    def _load_sidecars(self):
+        nr_scans = len(self.meta["paths"])
+        # sidecars can be one append ahead of meta.json after a crash
+        self.times = np.load(f"{self.archive_dir}/times.npy")[:nr_scans]
+        self.vres = np.load(f"{self.archive_dir}/vres.npy")[:nr_scans]
+        self.res = np.load(f"{self.archive_dir}/res.npy")[:nr_scans]
+        self.nr_res = np.load(f"{self.archive_dir}/nr_res.npy")[:nr_scans]
+        self.time_order = np.argsort(self.times[:, 0], kind = "stable")
+        shape = (nr_scans, self.meta["nr_channels"], self.meta["nr_samples"], self.meta["order"])
+        if nr_scans == 0:
+            # an empty file can not be memory mapped
+            self.coeffs = np.empty(shape, dtype = self.meta["dtype"])
+        else:
+            self.coeffs = np.memmap(f"{self.archive_dir}/coeffs.bin", dtype = self.meta["dtype"], mode = "r", shape = shape)
+
+    @property
+    def nr_scans(self):
+        return len(self.meta["paths"])
+
+    @property
+    def paths(self):
+        return self.meta["paths"]
+
+    def append(self, vc_files, verbose = True):
+        """
+        Adds the VC files that are not in the archive yet, returns the number of scans added
+        """
+        new_files = [vc_file for vc_file in vc_files if vc_file not in self.meta["paths"]]
+        if len(new_files) == 0:
+            return 0
+
+        scan_size = self.meta["nr_channels"] * self.meta["nr_samples"] * self.meta["order"] * np.dtype(self.meta["dtype"]).itemsize
+        times, vres, res = list(self.times), list(self.vres), list(self.res)
+        nr_res = list(self.nr_res)
+        with open(f"{self.archive_dir}/coeffs.bin", "r+b") as coeffs_file:
+            # drop whatever a crashed append left behind
+            coeffs_file.truncate(self.nr_scans * scan_size)
+            coeffs_file.seek(0, os.SEEK_END)
+            for i, vc_file in enumerate(new_files):
+                if verbose:
+                    print(f"archiving {i + 1}/{len(new_files)}: {os.path.basename(vc_file)}")
+                # archived files are read once, they do not need to go to the VC cache
+                vc = voltageCalibration(vc_file, use_cache = False)
+                coeffs_file.write(np.ascontiguousarray(vc.coeffs, dtype = self.meta["dtype"]).tobytes())
+                times.append(np.array(vc.get_times(), dtype = np.int64))
+                vres.append(np.asarray(vc.vres))
+                res.append(np.asarray(vc.res))
+                nr_res.append(len(vc.vres))
+
+        max_res = max(nr_res)
+        pad = lambda tables : np.array([np.pad(table, ((0, max_res - len(table)), (0, 0)), constant_values = np.nan)
+                                        for table in tables])
+        self._write_sidecars(self.archive_dir, np.array(times), pad(vres), pad(res), np.array(nr_res))
+        self.meta["paths"] += new_files
+        self._write_meta(self.archive_dir, self.meta)
+        self._load_sidecars()
+        return len(new_files)
+
+    def get_scans(self, t_min = None, t_max = None):
+        """
+        Scan indices, in time order, of the scans starting within [t_min, t_max]
+        """
+        start_times = self.times[self.time_order, 0]
+        first = 0 if t_min is None else np.searchsorted(start_times, t_min, side = "left")
+        last = len(start_times) if t_max is None else np.searchsorted(start_times, t_max, side = "right")
+        return self.time_order[first:last]
+
+    def get_coeffs(self, scans = None, channels = slice(None), samples = slice(None)):
+        """
+        Coefficients of shape [scans, channels, samples, order], only the requested part is read from disk
+        scans : scan indices (e.g. from get_scans), all scans in time order if None
+        channels, samples : index, slice or list
+        """
+        scans = self.time_order if scans is None else np.atleast_1d(scans)
+        if np.ndim(channels) and np.ndim(samples):
+            # two index lists select all their combinations, not pairs
+            channels, samples = np.ix_(channels, samples)
+        # consecutive scans are read as one slice
+        if len(scans) > 0 and np.all(np.diff(scans) == 1):
+            return self.coeffs[scans[0] : scans[-1] + 1, channels, samples]
+        return np.stack([self.coeffs[scan, channels, samples] for scan in scans])
+
+    def get_residuals(self, scan):
+        """
+        Residual table of one scan, shape [points, DAC] as in voltageCalibration
+        """
+        return self.vres[scan, : self.nr_res[scan]], self.res[scan, : self.nr_res[scan]]
+
+    def get_calibration(self, scan):
+        """
+        voltageCalibration of one scan, backed by the memory map
+        """
+        vres, res = self.get_residuals(scan)
+        return voltageCalibration.from_arrays(self.coeffs[scan], vres, res, tuple(self.times[scan]),
+                                              path = self.meta["paths"][scan])
+
+    def iter_calibrations(self, scans = None):
+        scans = self.time_order if scans is None else np.atleast_1d(scans)
+        for scan in scans:
+            yield self.get_calibration(scan)
@@ -0,0 +1,64 @@
+import argparse
+import os
+import tempfile
+import numpy as np
+import matplotlib.pyplot as plt
+import uproot
+
+from utility_functions import read_config
+from voltageCalibration import voltageCalibration
+from calibrationStage import CalibrationStage
+from adcToVoltage import evaluate_curve_and_slope
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = '%(prog)s')
+    parser.add_argument("vc")
+    parser.add_argument("--events", type = int, default = 200)
+    parser.add_argument("--step_size", type = int, default = 50)
+    parser.add_argument("--config", default = "config.json")
+    parser.add_argument("--max_error", type = float, default = 1e-3, help = "allowed round trip error in V")
+    args = parser.parse_args()
+    config = read_config(args.config)
+
+    vc = voltageCalibration(args.vc)
+
+    # synthetic waveforms: a sine in voltage, converted to ADC with the calibration itself
+    rng = np.random.default_rng(0)
+    starting_window = rng.integers(0, 32, args.events)
+    t = np.arange(2048)
+    v_true = 0.4 * np.sin(2 * np.pi * t / 512 + rng.uniform(0, 2 * np.pi, (args.events, 24, 1)))
+    adc = np.empty(v_true.shape)
+    for i, window in enumerate(starting_window):
+        coeffs = vc.get_window_coeffs(window)
+        for dac in range(2):
+            chs = slice(12 * dac, 12 * (dac + 1))
+            adc[i, chs] = evaluate_curve_and_slope(v_true[i, chs], np.moveaxis(coeffs[chs], -1, 0),
+                                                   vc.vres[:, dac], vc.res[:, dac])[0]
+    adc = np.round(adc).astype(np.int16)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        wf_path = os.path.join(tmp_dir, "waveforms.root")
+        with uproot.recreate(wf_path) as wf_file:
+            wf_file["waveforms"] = dict(radiant_data = adc, start_window = starting_window.astype(np.int32))
+
+        stage = CalibrationStage(vc, step_size = args.step_size, adc_branch = "radiant_data")
+        v_cal = np.concatenate([v for v in stage.iterate(wf_path)])
+
+    # rounding to integer ADC gives an error of about half an ADC count
+    max_error = np.max(np.abs(v_cal - v_true))
+    print(f"max error {max_error:.2e} V")
+    print(f"{stage.nr_events} events, {stage.nr_not_converged} samples not converged")
+    assert max_error < args.max_error, f"max error {max_error:.2e} V above {args.max_error:.0e} V"
+    assert stage.nr_not_converged == 0, f"{stage.nr_not_converged} samples did not converge"
+    print(f"throughput {stage.throughput():.1f} events/s")
+
+    fig, ax = plt.subplots(1, 1, figsize = (18, 12))
+    ax.plot(t, v_true[0, 0], label = "true")
+    ax.plot(t, v_cal[0, 0], label = "calibrated", ls = "dashed")
+    ax.set_xlabel("sample")
+    ax.set_ylabel("V")
+    ax.legend(loc = "best")
+
+    fig.suptitle("Test of the calibration stage, channel 0")
+    figname = f"{config['fig_dir']}/calibration_stage_test"
+    fig.savefig(figname, bbox_inches = "tight")
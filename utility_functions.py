@@ -10,12 +10,13 @@ from contextlib import contextmanager
 import uproot
 import numpy as np
 from scipy import interpolate
-from scipy.optimize import brentq
 import matplotlib.pyplot as plt
 from numba import jit
 import numba as nb
 import awkward as ak
 
+from adcToVoltage import get_samples_idx, solve_adc_to_v
+
 @contextmanager # decorator allows you to define a function for a with statement without defining a  __enter__() and __exit__() method
 def cwd(path):  # this specific function sets the working dorectory to path for all code in the with block
     oldpwd = os.getcwd()
@@ -48,6 +49,50 @@ def save_to_pickle(object, pickle_path):
         pickle.dump(object, pickle_file)
     return
 
+def stream_to_pickle(objects, pickle_path, header = None):
+    """
+    Writes every object of the iterable to pickle_path as soon as it arrives (one pickle record per object),
+    so the objects never have to be in memory together. The optional header (e.g. a dict with the station)
+    is written as the first record. The file only appears under pickle_path once the stream is complete.
+    returns the number of objects written
+    """
+    tmp_path = f"{pickle_path}.tmp"
+    nr_objects = 0
+    try:
+        with open(tmp_path, "wb") as pickle_file:
+            pickle.dump(header, pickle_file)
+            for object in objects:
+                pickle.dump(object, pickle_file)
+                nr_objects += 1
+    except BaseException:
+        # the source failed, do not leave a partial stream behind
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, pickle_path)
+    return nr_objects
+
+
+def iter_pickle_stream(pickle_path):
+    """
+    Reads a file written by stream_to_pickle, returns the header and a generator over the objects.
+    The generator opens the file itself, it is closed when the generator is exhausted, closed or collected
+    """
+    with open(pickle_path, "rb") as pickle_file:
+        header = pickle.load(pickle_file)
+
+    def objects():
+        with open(pickle_path, "rb") as pickle_file:
+            # skip the header
+            pickle.load(pickle_file)
+            while True:
+                try:
+                    yield pickle.load(pickle_file)
+                except EOFError:
+                    return
+    return header, objects()
+
+
 def find_nr_subplots(n, threshold = 6):
     n0 = n
     while n > threshold:
@@ -109,11 +154,18 @@ def unpack_time(path):
         time = bias_file["pedestals/when"].array(library = "np")
     return time
 
-def unpack_pedestal(run_path):
+def unpack_pedestal(run_path, catalog = None):
     pedestal_value = None
-    for pedestal_name in ["pedestal.root", "pedestals.root"]:
+    if catalog is None:
+        pedestal_paths = [f"{run_path}/{pedestal_name}" for pedestal_name in ["pedestal.root", "pedestals.root"]]
+    else:
+        # the catalog knows which pedestal file is there, no need to probe
+        pedestal_paths = [catalog.get_file(run_path, "pedestal")]
+        if pedestal_paths[0] is None:
+            return None
+    for pedestal_path in pedestal_paths:
         try:
-            with uproot.open(f"{run_path}/{pedestal_name}") as pedestal:
+            with uproot.open(pedestal_path) as pedestal:
                 pedestal_value = pedestal["pedestals"]["vbias[2]"].array(library = "np")
             break
         except:
@@ -167,35 +219,27 @@ def inverted_function(adc, param, vref, fit_min, fit_max):  #param = [a⁰, ...
     return(inverted_v)
 
 def cal_adc_to_v(ADC, param, vres, res, starting_window, 
-                 accuracy = 100, fit_min_rescaled = -1.3, fit_max_rescaled = 0.7):
-    
+                 accuracy = 100, fit_min_rescaled = -1.3, fit_max_rescaled = 0.7, return_converged = False):
+    """
+    return_converged : also return the mask of the samples that converged, samples outside of the curve on
+                       [fit_min_rescaled, fit_max_rescaled] (clamped to the closest end) and samples that did not
+                       converge (last iterate) are False. If not returned, their number is printed
+    """
     # an ADC measurement (typically) is 2048 samples long
     # bias scans always start on window 0
     # the two buffers run from window [0 - 15] and [16 - 31]
     # each window contains 128 samples
     # normal data start on a "random" window
-
-
-    samples_idx = (128 * starting_window + np.arange(2048)) % 2048
-    if starting_window >= 16:
-        samples_idx += 2048
+    samples_idx = get_samples_idx(starting_window, len(ADC))
     param_reordered = param[samples_idx]
-    # for discrete inverse 
-    # vsamples = np.arange(fit_min, fit_max, 1/accuracy)
-
-    v_array = []
-    for adc, p in zip(ADC, param_reordered):
-        # discrete inverse
-        # vpowers = np.array([v**np.arange(len(p)) for v in vsamples])
-        # adcsamples = np.array([np.sum(vpowers[i] * p) + np.interp(v, vres, res) for i, v in enumerate(vsamples)])
-        # adc_borders = adcsamples[np.where((adcsamples < adc))][-1], adcsamples[np.where(adc < adcsamples)][0], 
-        
-        # full inverse
-        # f = polynomial(V) + R(V)
-        func = lambda v : np.sum(v**np.arange(len(p)) * p) + np.interp(v, vres, res) - adc
-        v = brentq(func, fit_min_rescaled, fit_max_rescaled)
-        v_array.appendi(v)
-    v_array = np.array(v_array)
+
+    # full inverse of f = polynomial(V) + R(V), solved for all samples at once
+    v_array, converged = solve_adc_to_v(ADC, param_reordered, vres, res,
+                                        v_min = fit_min_rescaled, v_max = fit_max_rescaled)
+    if return_converged:
+        return v_array, converged
+    if not np.all(converged):
+        print(f"cal_adc_to_v: {np.sum(~converged)} of {converged.size} samples clamped or not converged")
     return v_array
 
 def sort_per_time(time_array, array):
@@ -0,0 +1,97 @@
+"""
+Local cache of parsed VC*.root files.
+Every entry is a directory of .npy files (coefficients, residuals, times) that can be memory mapped,
+keyed on the path, size and modification time of the source file.
+The cache location and size cap can be set with the VC_CACHE_DIR and VC_CACHE_SIZE (bytes) environment variables,
+the least recently used entries are removed when the cache grows above the cap.
+"""
+
+import os
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+
+
+CACHE_DIR = os.environ.get("VC_CACHE_DIR", os.path.expanduser("~/.cache/voltage_calibration"))
+CACHE_SIZE = int(os.environ.get("VC_CACHE_SIZE", 5 * 1024**3))
+CACHE_FIELDS = ["coeffs", "vres", "res", "times"]
+
+
+def cache_key(path):
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def load_from_cache(path, cache_dir = None):
+    """
+    returns a dict with the cached (memory mapped) arrays of path, None if path is not cached
+    """
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    entry = os.path.join(cache_dir, cache_key(path))
+    if not os.path.isdir(entry):
+        return None
+    try:
+        data = {field : np.load(f"{entry}/{field}.npy", mmap_mode = "r") for field in CACHE_FIELDS}
+        # the modification time of an entry is its last use
+        os.utime(entry)
+    except (OSError, ValueError):
+        return None
+    return data
+
+
+def store_in_cache(path, coeffs, vres, res, times, cache_dir = None, cache_size = None):
+    """
+    Writes the parsed arrays of path to the cache, the entry only appears once it is complete
+    """
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    os.makedirs(cache_dir, exist_ok = True)
+    entry = os.path.join(cache_dir, cache_key(path))
+
+    tmp_entry = tempfile.mkdtemp(prefix = ".tmp_", dir = cache_dir)
+    try:
+        for field, array in zip(CACHE_FIELDS, [coeffs, vres, res, np.array(times)]):
+            np.save(f"{tmp_entry}/{field}.npy", array)
+        os.rename(tmp_entry, entry)
+    except OSError:
+        # another process stored the same entry in the meantime
+        shutil.rmtree(tmp_entry, ignore_errors = True)
+    evict(cache_dir, cache_size)
+    return
+
+
+def get_entry_size(entry):
+    return sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+
+
+def evict(cache_dir = None, cache_size = None):
+    """
+    Removes the least recently used entries until the cache is below cache_size bytes
+    """
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    cache_size = CACHE_SIZE if cache_size is None else cache_size
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        if name.startswith(".tmp_") or not os.path.isdir(entry):
+            continue
+        try:
+            entries.append((os.path.getmtime(entry), get_entry_size(entry), entry))
+        except OSError:
+            continue
+
+    total_size = sum(entry[1] for entry in entries)
+    for _, size, entry in sorted(entries):
+        if total_size <= cache_size:
+            break
+        shutil.rmtree(entry, ignore_errors = True)
+        total_size -= size
+    return
+
+
+def clear_cache(cache_dir = None):
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    shutil.rmtree(cache_dir, ignore_errors = True)
@@ -0,0 +1,97 @@
+"""
+Native (NumPy) fit of the voltage calibration of a bias scan, replacing ROOT.mattak.VoltageCalibration.
+Every sample is fitted with a polynomial in the pedestal referenced frame (vbias and ADC shifted to the step
+closest to v_ref). All samples of a DAC share the same bias steps, so one QR factorization of the Vandermonde
+matrix per DAC solves the 12 x 4096 least squares problems at once. The averaged residual per DAC and step is
+stored as in the mattak files, so the output can be read by voltageCalibration.
+"""
+
+import os
+import re
+
+import numpy as np
+import uproot
+from scipy.linalg import solve_triangular
+
+from utility_functions import rescale_bias_scan, rescale_adc
+from biasScan import BiasScan
+
+
+NR_CHANNELS = 24
+
+
+def get_fit_range(vbias, v_ref, fit_min, fit_max, dac):
+    """
+    vbias of dac in the fit frame and the mask of the steps within the fit range
+    """
+    vbias_rescaled, fit_min_rescaled, fit_max_rescaled = rescale_bias_scan(vbias, v_ref, fit_min, fit_max, dac)
+    v = vbias_rescaled[:, dac]
+    return v, (fit_min_rescaled <= v) & (v <= fit_max_rescaled)
+
+
+def fit_bias_scan(vbias, adc, v_ref = 1.5, fit_min = 0.2, fit_max = 2.2, order = 10):
+    """
+    vbias : shape [steps, DAC]
+    adc : shape [steps, channels, samples]
+    fit_min, fit_max : fit range in bias voltage (before rescaling)
+    returns coeffs of shape [channels, samples, order] ([0th order, 1st order, ..]),
+    and per DAC the residual voltages and the residual averaged over the channels and samples of the DAC
+    """
+    nr_channels, nr_samples = adc.shape[1:]
+    coeffs = np.empty((nr_channels, nr_samples, order))
+    vres, res = [], []
+    for dac in range(2):
+        channels = np.flatnonzero((np.arange(nr_channels) > 11) == dac)
+        v, in_range = get_fit_range(vbias, v_ref, fit_min, fit_max, dac)
+        adc_dac = rescale_adc(vbias, adc[:, channels], v_ref, dac)[in_range]
+        adc_dac = adc_dac.reshape(len(adc_dac), -1).astype(np.float64)
+
+        vandermonde = v[in_range, np.newaxis] ** np.arange(order)
+        q, r = np.linalg.qr(vandermonde)
+        dac_coeffs = solve_triangular(r, q.T @ adc_dac)
+
+        residuals = adc_dac - vandermonde @ dac_coeffs
+        vres.append(v[in_range])
+        res.append(np.mean(residuals, axis = 1))
+        coeffs[channels] = dac_coeffs.T.reshape(len(channels), nr_samples, order)
+    return coeffs, vres, res
+
+
+def write_vc_file(path, coeffs, vres, res, times):
+    """
+    Writes a VC file in the layout of the mattak files (coeffs_tree, general_tree, aveResid_dac1/2)
+    coeffs : shape [channels, samples, order]
+    vres, res : residual voltages and values per DAC
+    times : (start time, end time) of the bias scan
+    """
+    tmp_path = f"{path}.tmp"
+    with uproot.recreate(tmp_path) as vc_file:
+        coeffs_tree = vc_file.mktree("coeffs_tree", {"coeff" : (np.float32, (coeffs.shape[-1],))})
+        coeffs_tree.extend({"coeff" : coeffs.reshape(-1, coeffs.shape[-1]).astype(np.float32)})
+        general_tree = vc_file.mktree("general_tree", {"startTime" : np.int64, "endTime" : np.int64})
+        general_tree.extend({"startTime" : np.array([times[0]], dtype = np.int64),
+                             "endTime" : np.array([times[1]], dtype = np.int64)})
+        for dac in range(2):
+            vc_file[f"aveResid_dac{dac + 1}"] = uproot.as_TGraph({"x" : np.asarray(vres[dac], dtype = np.float64),
+                                                                  "y" : np.asarray(res[dac], dtype = np.float64)})
+    os.replace(tmp_path, path)
+    return path
+
+
+def get_vc_filename(station, times):
+    return f"volCalConsts_pol9_s{station}_{int(times[0])}-{int(times[1])}.root"
+
+
+def fit_vc_file(bias_path, out_dir = None, station = None, **fit_kwargs):
+    """
+    Fits bias_path and writes the VC file to out_dir (the directory of the bias scan if None)
+    station : station number of the filename, taken from the station{nr} directory of bias_path if None
+    returns the path of the VC file
+    """
+    if station is None:
+        station = int(re.search(r"station(\d+)", bias_path).group(1))
+    with BiasScan(bias_path) as bias_scan:
+        times = bias_scan.get_times()
+        coeffs, vres, res = fit_bias_scan(bias_scan.vbias, bias_scan.get_adc(), **fit_kwargs)
+    out_dir = os.path.dirname(bias_path) if out_dir is None else out_dir
+    return write_vc_file(f"{out_dir}/{get_vc_filename(station, times)}", coeffs, vres, res, times)
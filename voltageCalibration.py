@@ -8,40 +8,196 @@ import time
 
 import numpy as np
 import matplotlib.pyplot as plt
-from numba import jit
+from numba import jit, prange
 import uproot
 
+from evaluationPlan import get_evaluation_plan
+from vcCache import load_from_cache, store_in_cache
+from adcToVoltage import extend_buffers, window_view, group_by_starting_window, solve_adc_to_v
+
+
+NR_CHANNELS = 24
+
+
+@jit(nopython = True)
+def find_residual_bin(v, vres):
+    """
+    Binary search for the first residual point above v,
+    clipped to [1, len(vres) - 1] so the outer segments are extrapolated
+    """
+    lo, hi = 1, len(vres) - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if v < vres[mid]:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+@jit(nopython = True)
+def residual_at(v, vres, res):
+    idx = find_residual_bin(v, vres)
+    return ((res[idx] - res[idx - 1]) / (vres[idx] - vres[idx - 1])) * (v - vres[idx - 1]) + res[idx - 1]
+
+
+@jit(nopython = True)
+def horner(coeff, v):
+    """
+    Coeff sequence assumed to be [0th order, 1th order, 2nd order, ..]
+    """
+    result = 0.
+    for k in range(len(coeff) - 1, -1, -1):
+        result = result * v + coeff[k]
+    return result
 
 
 @jit(nopython = True)
-def make_vc_curve(v, coeff, vres, res):
+def make_vc_curve(v, coeff, vres, res, out):
     """
-    Function for 1 channel, 1 sample
+    Function for 1 channel, 1 sample, the curve is written into out
     Coeff sequence assumed to be [0th order, 1th order, 2nd order, ..]
     """
-    poly_eval = np.zeros(len(v), dtype = np.float32)
-    for i, v in enumerate(v):
-        for j, r_v in enumerate(vres):
-            if v < r_v:
-                idx = j
-                break
-        res_inter = ((res[idx] - res[idx - 1]) / (vres[idx] - vres[idx - 1])) * (v - vres[idx - 1]) + res[idx - 1]
-        var_list = np.array([v**i for i in range(10)], dtype = np.float32)
-        evaluated = coeff.dot(var_list)
-        poly_eval[i] = evaluated + res_inter
-    return poly_eval
+    for i in range(len(v)):
+        out[i] = horner(coeff, v[i]) + residual_at(v[i], vres, res)
+    return out
+
+
+@jit(nopython = True, parallel = True)
+def make_vc_curves(v, coeffs, vres, res, channels, samples, out):
+    """
+    Function for many channels and samples, parallelized over (channel, sample) pairs
+    v, vres, res : shape [points, DAC]
+    coeffs : shape [channel, sample, order], only the requested channels and samples are read
+    out : shape [channels, samples, points]
+    """
+    # the residual only depends on the DAC so it is evaluated once per point
+    residual = np.empty((v.shape[0], 2))
+    for dac in range(2):
+        for p in range(v.shape[0]):
+            residual[p, dac] = residual_at(v[p, dac], vres[:, dac], res[:, dac])
+
+    n_samples = len(samples)
+    for k in prange(len(channels) * n_samples):
+        i = k // n_samples
+        j = k % n_samples
+        ch = channels[i]
+        dac = 1 if ch > 11 else 0
+        coeff = coeffs[ch, samples[j]]
+        for p in range(v.shape[0]):
+            out[i, j, p] = horner(coeff, v[p, dac]) + residual[p, dac]
+    return out
+
+
+def interpolate_residual(v, vres, res):
+    """
+    Vectorized version of the residual interpolation in make_vc_curve,
+    points outside of vres are extrapolated from the outer segments
+    """
+    idx = np.clip(np.searchsorted(vres, v, side = "right"), 1, len(vres) - 1)
+    slope = (res[idx] - res[idx - 1]) / (vres[idx] - vres[idx - 1])
+    return slope * (v - vres[idx - 1]) + res[idx - 1]
 
 
 class voltageCalibration():
     """
     Class to read in voltage calibration constants and residuals from VC*.root files
+    lazy : only read the times when opening the file, the coefficients are read on first use
+           and only for the channels that are needed, the residuals also on first use
+    use_cache : read the file from the local cache (see vcCache) if it is there,
+                files that are read completely are added to the cache
     """
-    def __init__(self, path) -> None:
+    def __init__(self, path, lazy = False, use_cache = True) -> None:
+        self.path = path
+        self._coeffs = None
+        self._loaded_channels = np.zeros(NR_CHANNELS, dtype = bool)
+        self._vres, self._res = None, None
+        # coefficients with doubled buffers, made on first use (see get_window_coeffs)
+        self._extended_coeffs = None
+
+        cached = load_from_cache(path) if use_cache else None
+        if cached is not None:
+            self._set_arrays(cached["coeffs"], cached["vres"], cached["res"], tuple(np.array(cached["times"])))
+            return
 
         with uproot.open(path) as f:
-            coeffs = np.stack(f["coeffs_tree/coeff"].array(library = 'np'))
             start_time = f["general_tree/startTime"].array(library = "np")[0]
             end_time = f["general_tree/endTime"].array(library = "np")[0]
+        self.times = start_time, end_time
+
+        if not lazy:
+            self.load_channels()
+            self.load_residuals()
+            if use_cache:
+                try:
+                    store_in_cache(path, self._coeffs, self._vres, self._res, self.times)
+                except OSError:
+                    # an unwritable cache should not stop the analysis
+                    pass
+
+    @classmethod
+    def from_arrays(cls, coeffs, vres, res, times, path = None):
+        """
+        Calibration from already parsed arrays (e.g. a slice of a StationArchive)
+        coeffs : shape [channel, sample, order]
+        vres, res : shape [points, DAC]
+        """
+        vc = cls.__new__(cls)
+        vc.path = path
+        vc._loaded_channels = np.zeros(NR_CHANNELS, dtype = bool)
+        vc._extended_coeffs = None
+        vc._set_arrays(coeffs, vres, res, times)
+        return vc
+
+    def _set_arrays(self, coeffs, vres, res, times):
+        self._coeffs = coeffs
+        self._loaded_channels[:] = True
+        self._vres, self._res = vres, res
+        self.times = times
+
+    @property
+    def coeffs(self):
+        return self.load_channels()
+
+    @property
+    def vres(self):
+        return self.load_residuals()[0]
+
+    @property
+    def res(self):
+        return self.load_residuals()[1]
+
+    def load_channels(self, channels = None):
+        """
+        Reads the coefficients of channels (all if None) that were not read yet, one read per range of channels,
+        returns the coefficient array of shape [channel, sample, order] (channels not read yet are uninitialized)
+        """
+        missing = np.zeros(NR_CHANNELS, dtype = bool)
+        missing[slice(None) if channels is None else np.atleast_1d(channels)] = True
+        missing &= ~self._loaded_channels
+        if not np.any(missing):
+            return self._coeffs
+
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], missing.astype(int), [0]])))
+        with uproot.open(self.path) as f:
+            coeff_branch = f["coeffs_tree/coeff"]
+            nr_samples = coeff_branch.num_entries // NR_CHANNELS
+            for first, last in zip(edges[::2], edges[1::2]):
+                coeffs = np.stack(coeff_branch.array(entry_start = first * nr_samples,
+                                                     entry_stop = last * nr_samples,
+                                                     library = 'np'))
+                coeffs = coeffs.reshape((last - first, nr_samples, -1))
+                if self._coeffs is None:
+                    self._coeffs = np.empty((NR_CHANNELS, nr_samples, coeffs.shape[-1]), dtype = coeffs.dtype)
+                self._coeffs[first:last] = coeffs
+        self._loaded_channels |= missing
+        return self._coeffs
+
+    def load_residuals(self):
+        if self._vres is not None:
+            return self._vres, self._res
+
+        with uproot.open(self.path) as f:
             vres_dac1, vres_dac2 = f["aveResid_dac1"].member("fX"), f["aveResid_dac2"].member("fX")
             residual_dac1, residual_dac2 = f["aveResid_dac1"].member("fY"), f["aveResid_dac2"].member("fY")
             diff = len(vres_dac1) - len(vres_dac2)
@@ -51,20 +207,93 @@ class voltageCalibration():
             elif diff < 0:
                 vres_dac2 = vres_dac2[:diff]
                 residual_dac2 = residual_dac2[: diff]
-        
-        self.coeffs = coeffs.reshape((24, 4096,10))
-        self.times = start_time, end_time
-        self.vres = np.stack(np.array([vres_dac1, vres_dac2]), axis = -1)
-        self.res = np.stack(np.array([residual_dac1, residual_dac2]), axis = -1)
+
+        self._vres = np.stack(np.array([vres_dac1, vres_dac2]), axis = -1)
+        self._res = np.stack(np.array([residual_dac1, residual_dac2]), axis = -1)
+        return self._vres, self._res
 
     def get_fit_curve(self, v, channel, sample):
         """
         v : shape [points, DAC]
         """
         dac = int(channel > 11)
-        adc = make_vc_curve(v, self.coeffs[channel, sample], self.vres[:, dac], self.res[:, dac])
+        v = np.asarray(v, dtype = np.float64)
+        adc = np.empty(len(v), dtype = np.float32)
+        coeffs = self.load_channels(channel)
+        make_vc_curve(v, coeffs[channel, sample], self.vres[:, dac], self.res[:, dac], adc)
+
+        return adc
+
+    def get_fit_curves(self, v, channels = None, samples = None, dtype = np.float32, use_plan = True):
+        """
+        Evaluates the calibration curves of several channels and samples at once
+        v : shape [points] (same grid for both DACs) or [points, DAC]
+        channels, samples : indices to evaluate, all of them if None
+        use_plan : evaluate as a matrix product with a cached EvaluationPlan,
+                   otherwise the parallel numba kernel is used
+        returns array of shape [channels, samples, points]
+        """
+        channels = np.arange(NR_CHANNELS) if channels is None else np.atleast_1d(channels)
+        coeffs = self.load_channels(channels)
+        samples = np.arange(coeffs.shape[1]) if samples is None else np.atleast_1d(samples)
+        v = np.asarray(v, dtype = np.float64)
+        if v.ndim == 1:
+            v = np.stack([v, v], axis = -1)
+
+        adc = np.empty((len(channels), len(samples), len(v)), dtype = dtype)
+        if use_plan:
+            for dac in range(2):
+                dac_mask = (channels > 11) == dac
+                if not np.any(dac_mask):
+                    continue
+                plan = get_evaluation_plan(v[:, dac], self.vres[:, dac], order = coeffs.shape[-1])
+                adc[dac_mask] = plan.evaluate(coeffs[np.ix_(channels[dac_mask], samples)], self.res[:, dac])
+            return adc
 
+        make_vc_curves(v, coeffs, self.vres, self.res,
+                       channels.astype(np.int64), samples.astype(np.int64), adc)
         return adc
 
+    def get_window_coeffs(self, starting_window, nr_samples = 2048):
+        """
+        Coefficients reordered for a waveform that starts on starting_window, shape [channels, nr_samples, order].
+        This is a view, only one copy of the coefficients (with doubled buffers) is made per calibration
+        """
+        if self._extended_coeffs is None:
+            self._extended_coeffs = extend_buffers(self.coeffs)
+        return window_view(self._extended_coeffs, starting_window, nr_samples)
+
+    def adc_to_v(self, adc, starting_window = 0, channels = None,
+                 v_min = -1.3, v_max = 0.7, tol = 1e-6, max_iter = 50):
+        """
+        Converts a block of waveforms to voltage by inverting the calibration curves,
+        events sharing a starting window are calibrated together
+        adc : shape [events, channels, samples]
+        starting_window : scalar or shape [events]
+        channels : channel numbers of the channel axis of adc, range(adc.shape[1]) if None
+        returns v and a converged mask, both of shape [events, channels, samples]
+        """
+        adc = np.asarray(adc)
+        channels = np.arange(adc.shape[1]) if channels is None else np.atleast_1d(channels)
+        if np.ndim(starting_window) == 0:
+            groups = [(starting_window, np.arange(adc.shape[0]))]
+        else:
+            groups = group_by_starting_window(starting_window)
+
+        v = np.empty(adc.shape)
+        converged = np.empty(adc.shape, dtype = bool)
+        for window, events in groups:
+            window_coeffs = self.get_window_coeffs(window, adc.shape[-1])
+            for dac in range(2):
+                dac_idx = np.flatnonzero((channels > 11) == dac)
+                if len(dac_idx) == 0:
+                    continue
+                group = np.ix_(events, dac_idx)
+                v[group], converged[group] = solve_adc_to_v(adc[group], window_coeffs[channels[dac_idx]],
+                                                            self.vres[:, dac], self.res[:, dac],
+                                                            v_min = v_min, v_max = v_max,
+                                                            tol = tol, max_iter = max_iter)
+        return v, converged
+
     def get_times(self):
         return self.times
\ No newline at end of file